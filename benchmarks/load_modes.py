@@ -0,0 +1,62 @@
+import argparse
+import random
+import time
+from datetime import datetime
+
+from psycopg import sql
+
+from em.entity.entities import PostgresMockEntity
+from em.entity.specs import MockEntitySpec, LoadModeType
+
+# compares the executemany INSERT path against COPY on the same records
+# PYTHONPATH=python python benchmarks/load_modes.py --records 100000
+
+def build_records(count: int):
+    now = datetime.now()
+    return [
+        {
+            'name': random.choice(['Alex', 'Peter', 'John', 'Mike']),
+            'nick_name': random.choice(['Elephan', 'Monkey', None]),
+            'salary': random.randint(100, 350),
+            'registered_at': now,
+            'created_at': now,
+            'updated_at': now
+        }
+        for _ in range(count)
+    ]
+
+def main(**kwargs):
+    spec = MockEntitySpec(name='em_bench_load_modes', schema='public', fields=[], preview={ 'mode': 'off' })
+    entity = PostgresMockEntity(spec)
+
+    with entity.connector.create_session() as session:
+        session.conn.execute(sql.SQL('''
+            CREATE TABLE IF NOT EXISTS {table} (
+                id              BIGINT                      NOT NULL PRIMARY KEY GENERATED ALWAYS AS IDENTITY,
+                name            VARCHAR                     NOT NULL,
+                nick_name       VARCHAR                     NULL,
+                salary          INTEGER                     NOT NULL,
+                registered_at   TIMESTAMP WITH TIME ZONE    NOT NULL,
+                created_at      TIMESTAMP WITH TIME ZONE    NOT NULL,
+                updated_at      TIMESTAMP WITH TIME ZONE    NOT NULL
+            )
+        ''').format(table=entity.get_table()))
+
+    records = build_records(kwargs['records'])
+    try:
+        for load_mode in LoadModeType:
+            with entity.connector.create_session() as session:
+                session.conn.execute(sql.SQL('TRUNCATE {table}').format(table=entity.get_table()))
+            started_at = time.perf_counter()
+            entity.insertall(records, load_mode)
+            elapsed = time.perf_counter() - started_at
+            print(f'{load_mode.value:>8}: {len(records)} rows in {elapsed:.3f}s, {len(records) / elapsed:,.0f} rows/s')
+    finally:
+        with entity.connector.create_session() as session:
+            session.conn.execute(sql.SQL('DROP TABLE IF EXISTS {table}').format(table=entity.get_table()))
+
+parser = argparse.ArgumentParser(description='Compare Postgres load modes')
+parser.add_argument('--records', type=int, default=100000, help='Records per load mode')
+
+if __name__ == '__main__':
+    main(**vars(parser.parse_args()))
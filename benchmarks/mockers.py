@@ -0,0 +1,116 @@
+import argparse
+import math
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from em.entity.entities import MockEntity
+from em.entity.mockers import (
+    MockContext,
+    EntityMocker,
+    ConstantFieldMocker,
+    RandomFieldMocker,
+    RandomIntFieldMocker,
+    RandomDecimalFieldMocker,
+    RandomDateTimeFieldMocker,
+    CurrentDateTimeFieldMocker
+)
+from em.entity.specs import MockEntityFieldSpec, MockEntitySpec, TimePrecisionType
+
+# compares the former row-wise mockers (one random call per value) against column-wise mock_batch() calls
+# PYTHONPATH=python python benchmarks/mockers.py --records 100000
+
+field_mocker_klasses = {
+    'constant': ConstantFieldMocker,
+    'random': RandomFieldMocker,
+    'random_int': RandomIntFieldMocker,
+    'random_decimal': RandomDecimalFieldMocker,
+    'random_datetime': RandomDateTimeFieldMocker,
+    'current_datetime': CurrentDateTimeFieldMocker
+}
+
+entity_spec = MockEntitySpec(name='bench', fields=[
+    { 'name': 'constant', 'type': 'constant', 'nullable': True, 'seeds': ['Alex', 'Peter', 'John', 'Mike'] },
+    { 'name': 'random', 'type': 'random', 'seeds': ['Elephan', 'Monkey', 'Holiday'] },
+    { 'name': 'random_int', 'type': 'random_int', 'min': 100, 'max': 350, 'precision': 10 },
+    { 'name': 'random_decimal', 'type': 'random_decimal', 'min': 0, 'max': 1000, 'precision': 2 },
+    { 'name': 'random_datetime', 'type': 'random_datetime', 'interval': '1m' },
+    { 'name': 'current_datetime', 'type': 'current_datetime', 'precision': 'hour' }
+])
+
+class NullMockEntity(MockEntity):
+    def load_records(self) -> None:
+        pass
+
+    def insertall(self, records, load_mode=None) -> None:
+        pass
+
+def build_row_mocker(field_spec: MockEntityFieldSpec):
+    # the row-wise implementation of each field type before mock_batch, kept as the baseline
+    seeds = field_spec.seeds
+    if field_spec.type == 'constant':
+        return lambda index: None if field_spec.nullable and random.random() < 0.4 else seeds[index % len(seeds)]
+    if field_spec.type == 'random':
+        return lambda index: random.choice(seeds)
+    if field_spec.type == 'random_int':
+        rounding_base = field_spec.precision if field_spec.precision else 1
+        return lambda index: math.ceil(random.randint(int(field_spec.min), int(field_spec.max)) / rounding_base) * rounding_base
+    if field_spec.type == 'random_decimal':
+        quantum = Decimal(10) ** -(field_spec.precision if field_spec.precision else 3)
+        return lambda index: Decimal((field_spec.max - field_spec.min) * random.random() + field_spec.min).quantize(quantum, ROUND_HALF_UP)
+    if field_spec.type == 'random_datetime':
+        max_dt = datetime.now()
+        min_dt = max_dt - timedelta(hours=24)
+        interval_td = timedelta(**{ { 's': 'seconds', 'm': 'minutes', 'h': 'hours' }[field_spec.interval[-1]]: int(field_spec.interval[:-1]) })
+        timeslots = (max_dt - min_dt) // interval_td
+        return lambda index: min_dt + interval_td * random.randint(0, timeslots)
+    if field_spec.type == 'current_datetime':
+        truncated = { TimePrecisionType.HOUR: dict(minute=0, second=0, microsecond=0), TimePrecisionType.MINUTE: dict(second=0, microsecond=0), TimePrecisionType.SECOND: dict(microsecond=0) }.get(field_spec.precision, {})
+        return lambda index: datetime.now().replace(**truncated)
+    raise Exception(f'Unknown field type, type={field_spec.type}')
+
+def mock_rows(field_specs, records: int):
+    row_mockers = [ (field_spec.name, build_row_mocker(field_spec)) for field_spec in field_specs ]
+    for i in range(records):
+        updating = {}
+        for name, row_mocker in row_mockers:
+            updating[name] = row_mocker(i)
+
+def mock_columns(field_mockers, records: int, batch_size: int):
+    for start in range(0, records, batch_size):
+        size = min(batch_size, records - start)
+        for field_mocker in field_mockers:
+            field_mocker.mock_batch(size, MockContext(index=start, updating={}, field_mocker=field_mocker), None)
+
+def rate(records: int, function, *args) -> float:
+    started_at = time.perf_counter()
+    function(*args)
+    return records / (time.perf_counter() - started_at)
+
+def main(**kwargs):
+    records, batch_size = kwargs['records'], kwargs['batch_size']
+    field_mockers = []
+    for field_spec in entity_spec.fields:
+        field_mocker = field_mocker_klasses[field_spec.type](field_spec)
+        field_mocker.prepare()
+        field_mockers.append(field_mocker)
+
+    print(f'{"field":>20} {"rows/s before":>15} {"rows/s after":>15}')
+    for field_mocker in field_mockers:
+        before = rate(records, mock_rows, [field_mocker.spec], records)
+        after = rate(records, mock_columns, [field_mocker], records, batch_size)
+        print(f'{field_mocker.get_name():>20} {before:>15,.0f} {after:>15,.0f}')
+
+    # whole records, including the conversion of columns to records
+    entity_mocker = EntityMocker(entity_spec, NullMockEntity(entity_spec), field_mockers)
+    before = rate(records, mock_rows, entity_spec.fields, records)
+    after = rate(records, lambda: [ entity_mocker.mock_records(start, min(start + batch_size, records)) for start in range(0, records, batch_size) ])
+    print(f'{"entity":>20} {before:>15,.0f} {after:>15,.0f}')
+
+parser = argparse.ArgumentParser(description='Compare row-wise and column-wise field mockers')
+parser.add_argument('--records', type=int, default=100000, help='Records per field mocker')
+parser.add_argument('--batch_size', type=int, default=1000, help='Records per mock_batch call')
+
+if __name__ == '__main__':
+    main(**vars(parser.parse_args()))
@@ -1,43 +1,21 @@
-import yaml
 import os
-import graphlib
 from loguru import logger
-from typing import List, Dict, Set
 import argparse
+import signal
 import sys
+from contextlib import ExitStack
 
-from em.entity.seeders import (
-    FieldSeeder,
-    EntityFieldSeeder,
-    FileFieldSeeder
+from em.entity.entities import PostgresConnector
+from em.entity.builders import (
+    build_entity_deps,
+    build_entity_mockers
 )
-
-from em.entity.entities import (
-    MockEntity,
-    PostgresMockEntity,
-    PostgresSeedEntity
-)
-
-from em.entity.mockers import (
-    FieldMocker,
-    CurrentDateTimeFieldMocker,
-    RandomDateTimeFieldMocker,
-    CustomFieldMocker,
-    RandomDecimalFieldMocker,
-    RandomIntFieldMocker,
-    ConstantFieldMocker,
-    RandomFieldMocker
-)
-
-from em.entity.mockers import EntityMocker
-from em.utils.import_utils import load_class
+from em.entity.loaders import SpecLoader
+from em.entity.schedulers import EntityScheduler, RateScheduler
+from em.utils.profile_utils import profiler
 
 from em.entity.specs import (
-    Spec,
-    MockEntitySpec,
-    MockEntityFieldSpec,
-    SpecType,
-    ScenarioSpec,
+    ScenarioEntitySpec,
 )
 
 def main(**kwargs):
@@ -51,97 +29,28 @@ def main(**kwargs):
     if len(input_files) == 0:
         raise Exception(f'input files must be specified with --input_dir or --input_file')
 
-    scenario_specs: Dict[str, ScenarioSpec] = {}
-
-    entity_specs: Dict[str, MockEntitySpec] = {}
-    entity_deps: Dict[str, Set[str]] = {}
-
-    # parse input files
-    for input_file in input_files:
-        # skip non yaml files
-        if not input_file.lower().endswith(('yaml', 'yml')):
-            continue
-        # check if file
-        if not os.path.isfile(input_file):
-            logger.error(f'Input must be a file, path={input_file}')
-            continue
-        # load yaml
-        with open(input_file) as f:
-            input_data = yaml.safe_load(f)
-        
-        spec = Spec(**input_data)
-        if spec.kind == SpecType.SCENARIO:
-            scenario_spec = spec.spec
-            scenario_specs[scenario_spec.name] = scenario_spec
-        elif spec.kind == SpecType.ENTITY:
-            # convert yaml to pydantic
-            entity_spec = spec.spec
-            entity_specs[entity_spec.name] = entity_spec
-            # build entity_deps
-            entity_deps[entity_spec.name] = { field_spec.seedsFromEntity.name for field_spec in entity_spec.fields if field_spec.seedsFromEntity }
+    # parse input files, unchanged files are read from the spec cache
+    spec_loader = SpecLoader(kwargs['spec_cache'])
+    scenario_specs, entity_specs = spec_loader.load(input_files)
 
     logger.info(f'Loaded {len(scenario_specs)} scenarios and {len(entity_specs)} entities, scenarios={list(scenario_specs.keys())}, entities={list(entity_specs.keys())}')
     
-    entity_impls: Dict[str, type[MockEntity]] = {}
-
     # build entity mockers
-    entity_top_sorter = graphlib.TopologicalSorter(entity_deps)
-    sorted_entity_specs = [ entity_specs[entity_name] for entity_name in entity_top_sorter.static_order() if entity_name in entity_specs ]
-    entity_mockers: List[EntityMocker] = []
-    for entity_spec in sorted_entity_specs:
-        # build entity implementation
-        entity_impl_klass = load_class(entity_spec.implementation, MockEntity)
-        entity_impl = entity_impl_klass(entity_spec)
-
-        field_mocker_klasses: Dict[str, type[FieldMocker]] = {
-            'custom': CustomFieldMocker,
-            'constant': ConstantFieldMocker,
-            'random': RandomFieldMocker,
-            'random_int': RandomIntFieldMocker,
-            'random_decimal': RandomDecimalFieldMocker,
-            'current_datetime': CurrentDateTimeFieldMocker,
-            'random_datetime': RandomDateTimeFieldMocker
-        }
-
-        field_specs: Dict[str, MockEntityFieldSpec] = { field_spec.name: field_spec for field_spec in entity_spec.fields }
-        
-        # build field deps
-        field_deps = { field_spec.name: set(field_spec.dependencies) for field_spec in entity_spec.fields }
-        field_top_sorter = graphlib.TopologicalSorter(field_deps)
-        sorted_field_specs = [ field_specs[field_name] for field_name in field_top_sorter.static_order() if field_name in field_specs ]
-
-        # build field mockers
-        field_mockers = []
-        for field_spec in sorted_field_specs:
-            seeder: type[FieldSeeder] = None
-
-            if field_spec.seedsFromEntity:
-                # build seed entity impl
-                seed_entity_name = field_spec.seedsFromEntity.name
-                if seed_entity_name in entity_impls:
-                    seed_entity_impl = entity_impls[seed_entity_name]
-                elif issubclass(entity_impl_klass, PostgresMockEntity):
-                    seed_entity_impl = PostgresSeedEntity(field_spec.seedsFromEntity.name, entity_spec.schema)
-                    entity_impls[seed_entity_name] = seed_entity_impl
-                # build entity seeder
-                seeder = EntityFieldSeeder(field_spec.seedsFromEntity, seed_entity_impl)
-
-            if field_spec.seedsFromFile:
-                # build file seeder
-                seeder = FileFieldSeeder(field_spec.seedsFromFile)
-
-            field_mocker = field_mocker_klasses[field_spec.type](field_spec, seeder)
-            field_mockers.append(field_mocker)
-
-        entity_mocker = EntityMocker(entity_spec, entity_impl, field_mockers)
-        entity_mockers.append(entity_mocker)
+    entity_deps = build_entity_deps(entity_specs)
+    entity_mockers = build_entity_mockers(entity_specs, entity_deps, spec_loader.get_entity_order(entity_deps))
+    spec_loader.save()
 
     # start mock
     scenario_name = kwargs['scenario']
+    if kwargs['daemon'] and not scenario_name:
+        raise Exception(f'A scenario must be specified with --scenario in daemon mode, scenarios={list(scenario_specs.keys())}')
     if len(scenario_specs) == 0:
+        # specs are checked against the sinks before any record is generated
+        for entity_mocker in entity_mockers:
+            entity_mocker.validate()
         for entity_mocker in entity_mockers:
             entity_mocker.load_entity_records()
-            entity_mocker.mock(1)
+            entity_mocker.mock(ScenarioEntitySpec(name=entity_mocker.entity_spec.name), kwargs['seed'])
     elif scenario_name:
         scenario_spec = scenario_specs[scenario_name]
         scenario_entity_specs = { scenario_entity_spec.name: scenario_entity_spec for scenario_entity_spec in scenario_spec.entities }
@@ -150,13 +59,36 @@ def main(**kwargs):
         unknown_entity_names = scenario_entity_specs.keys() - entity_specs.keys()
         if unknown_entity_names:
             raise Exception(f'Entity specs must be provided, names={list(unknown_entity_names)}')
+
+        scenario_entity_mockers = [ entity_mocker for entity_mocker in entity_mockers if entity_mocker.entity_spec.name in scenario_entity_specs ]
+        for entity_mocker in scenario_entity_mockers:
+            entity_mocker.validate(scenario_entity_specs[entity_mocker.entity_spec.name])
         
+        if kwargs['daemon']:
+            logger.info(f'Run scenario in daemon mode, name={scenario_name}')
+            rate_scheduler = RateScheduler(scenario_entity_mockers, kwargs['seed'])
+            signal.signal(signal.SIGTERM, lambda signum, frame: rate_scheduler.stop())
+            rate_scheduler.run(scenario_entity_specs)
+            return
+
         logger.info(f'Run scenario, name={scenario_name}')
-        for entity_mocker in entity_mockers:
-            scenario_entity_spec = scenario_entity_specs.get(entity_mocker.entity_spec.name)
-            if scenario_entity_spec:
+        if kwargs['workers'] > 1:
+            if scenario_spec.sharedTransaction:
+                raise Exception(f'A shared transaction can not be used with more than one worker, scenario={scenario_name}')
+            EntityScheduler(entity_specs, entity_deps, entity_mockers, kwargs['workers'], kwargs['seed']).run(scenario_entity_specs)
+            return
+
+        concurrent_entity_names = [ scenario_entity_spec.name for scenario_entity_spec in scenario_spec.entities if scenario_entity_spec.connections > 1 ]
+        if scenario_spec.sharedTransaction and concurrent_entity_names:
+            raise Exception(f'A shared transaction can not be written through more than one connection, scenario={scenario_name}, entities={concurrent_entity_names}')
+        with ExitStack() as stack:
+            if scenario_spec.sharedTransaction:
+                # entities sharing a connector join the transaction opened by the first one
+                for entity_mocker in scenario_entity_mockers:
+                    stack.enter_context(entity_mocker.entity.transaction())
+            for entity_mocker in scenario_entity_mockers:
                 entity_mocker.load_entity_records()
-                entity_mocker.mock(scenario_entity_spec)
+                entity_mocker.mock(scenario_entity_specs[entity_mocker.entity_spec.name], kwargs['seed'])
     else:
         raise Exception(f'A scenario must be specified with --scenario, scenarios={list(scenario_specs.keys())}')
 
@@ -165,11 +97,29 @@ parser.add_argument('--debug', action='store_true', help='Enable debug log')
 parser.add_argument('--input_dir', type=str, default='input', required=False, help='Directory that contains input yaml files')
 parser.add_argument('--input_file', type=str, action='append', default=[], help='Yaml file')
 parser.add_argument('--scenario', type=str, default=None, required=False, help='Scenario')
-
-args = parser.parse_args()
-args_dict = vars(args)
-logger.info(f'Loaded input arguements, arguements={args_dict}')
-try:
-    main(**args_dict)
-except KeyboardInterrupt:
-    logger.info('Execution interrupted by user')
\ No newline at end of file
+parser.add_argument('--workers', type=int, default=1, help='Entity shards generated and loaded in parallel')
+parser.add_argument('--seed', type=int, default=None, help='Seed of the random streams, for reproducible records')
+parser.add_argument('--daemon', action='store_true', help='Run the scenario continuously, at the rate of its entities, until stopped')
+parser.add_argument('--profile', action='store_true', help='Time field mockers, seeders, statements and entities, printed at the end of the run')
+parser.add_argument('--profile_output', type=str, default=None, help='File the profile is written to, json for .json files, prometheus text otherwise')
+parser.add_argument('--spec_cache', type=str, default=None, help='File caching validated input specs between runs, defaults to SPEC_CACHE_PATH')
+
+if __name__ == '__main__' and sys.argv[1:2] == ['bench']:
+    from em import bench
+    bench.main(**vars(bench.parser.parse_args(sys.argv[2:])))
+elif __name__ == '__main__':
+    args = parser.parse_args()
+    args_dict = vars(args)
+    logger.info(f'Loaded input arguements, arguements={args_dict}')
+    if args.profile:
+        profiler.enable()
+    try:
+        main(**args_dict)
+    except KeyboardInterrupt:
+        logger.info('Execution interrupted by user')
+    finally:
+        PostgresConnector.get_instance().close()
+        if args.profile:
+            profiler.print()
+            if args.profile_output:
+                profiler.write(args.profile_output)
\ No newline at end of file
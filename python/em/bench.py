@@ -0,0 +1,227 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+from psycopg import sql
+from prettytable import PrettyTable
+from loguru import logger
+
+from em.entity.builders import build_entity_deps, build_entity_mockers
+from em.entity.entities import MockEntity, PostgresMockEntity
+from em.entity.mockers import EntityMocker, MockContext
+from em.entity.specs import LoadModeType, MockEntitySpec
+
+# synthetic entities run at several sizes against each sink, one process per case so peak RSS is per case
+# PYTHONPATH=python python python/em bench --sizes 10000 100000 --output bench.json
+
+class NullMockEntity(MockEntity):
+    def load_records(self) -> None:
+        pass
+
+    def insertall(self, records: List[Dict[str, Any]], load_mode: LoadModeType = None) -> None:
+        pass
+
+def full_name(context: MockContext, entity: MockEntity) -> str:
+    return f'{context.updating["first_name"]} {context.updating["last_name"]}'
+
+def email(context: MockContext, entity: MockEntity) -> str:
+    return f'{context.updating["first_name"].lower()}.{context.index}@example.com'
+
+def total(context: MockContext, entity: MockEntity) -> List[Any]:
+    return [ price * quantity for price, quantity in zip(context.columns['price'], context.columns['quantity']) ]
+
+def build_fields(name: str, seeds_path: str) -> List[Dict[str, Any]]:
+    if name == 'narrow':
+        return [
+            { 'name': 'amount', 'type': 'random_int', 'min': 1, 'max': 1000 },
+            { 'name': 'status', 'type': 'constant', 'seeds': [ 'new', 'paid', 'shipped' ] },
+            { 'name': 'created_at', 'type': 'random_datetime', 'interval': '1s' }
+        ]
+    if name == 'wide':
+        fields = []
+        for i in range(8):
+            fields += [
+                { 'name': f'int_{i}', 'type': 'random_int', 'min': 0, 'max': 1000000 },
+                { 'name': f'decimal_{i}', 'type': 'random_decimal', 'min': 0, 'max': 1000, 'precision': 2 },
+                { 'name': f'datetime_{i}', 'type': 'random_datetime', 'interval': '1m' },
+                { 'name': f'constant_{i}', 'type': 'constant', 'nullable': True, 'seeds': [ 'a', 'b', 'c', 'd' ] },
+                { 'name': f'random_{i}', 'type': 'random', 'seeds': [ 'x', 'y', 'z' ] }
+            ]
+        return fields
+    if name == 'seeded':
+        return [
+            { 'name': 'first_name', 'type': 'random', 'seeds': [ f'name_{i}' for i in range(10000) ] },
+            { 'name': 'city', 'type': 'random', 'seedsFromFile': { 'path': seeds_path } },
+            { 'name': 'country', 'type': 'constant', 'seedsFromFile': { 'path': seeds_path } }
+        ]
+    if name == 'custom':
+        return [
+            { 'name': 'first_name', 'type': 'random', 'seeds': [ 'Alex', 'Peter', 'John', 'Mike' ] },
+            { 'name': 'last_name', 'type': 'random', 'seeds': [ 'Smith', 'Brown', 'Lee' ] },
+            { 'name': 'full_name', 'type': 'custom', 'function': 'em.bench.full_name', 'dependencies': [ 'first_name', 'last_name' ] },
+            { 'name': 'email', 'type': 'custom', 'function': 'em.bench.email', 'dependencies': [ 'first_name' ] },
+            { 'name': 'price', 'type': 'random_int', 'min': 1, 'max': 100 },
+            { 'name': 'quantity', 'type': 'random_int', 'min': 1, 'max': 10 },
+            { 'name': 'total', 'type': 'custom', 'function': 'em.bench.total', 'dependencies': [ 'price', 'quantity' ], 'batch': True }
+        ]
+    raise Exception(f'Unknown bench entity, name={name}')
+
+sink_implementations = {
+    'null': 'em.bench.NullMockEntity',
+    'file': 'em.entity.sinks.CsvMockEntity',
+    'parquet': 'em.entity.sinks.ParquetMockEntity',
+    'postgres': 'em.entity.entities.PostgresMockEntity'
+}
+
+column_types = {
+    'random_int': 'BIGINT',
+    'random_decimal': 'NUMERIC',
+    'random_datetime': 'TIMESTAMP WITH TIME ZONE',
+    'current_datetime': 'TIMESTAMP WITH TIME ZONE'
+}
+
+def create_table(entity: PostgresMockEntity) -> None:
+    columns = [ sql.SQL('{} {}').format(sql.Identifier(field_spec.name), sql.SQL(column_types.get(field_spec.type.value, 'TEXT'))) for field_spec in entity.spec.fields ]
+    with entity.connector.create_session() as session:
+        session.conn.execute(sql.SQL('DROP TABLE IF EXISTS {table}').format(table=entity.get_table()))
+        session.conn.execute(sql.SQL('CREATE TABLE {table} ({columns})').format(table=entity.get_table(), columns=sql.SQL(',').join(columns)))
+
+def drop_table(entity: PostgresMockEntity) -> None:
+    with entity.connector.create_session() as session:
+        session.conn.execute(sql.SQL('DROP TABLE IF EXISTS {table}').format(table=entity.get_table()))
+
+def time_fields(entity_mocker: EntityMocker, records: List[Dict[str, Any]], index: int) -> Dict[str, float]:
+    # ns per record of each field mocker, over a batch already mocked so dependencies are available,
+    # index is the index of its first record
+    size = len(records)
+    if not size:
+        return {}
+    columns = { name: [ record[name] for record in records ] for name in records[0] }
+    field_ns = {}
+    for field_mocker in entity_mocker.field_mockers:
+        started_at = time.perf_counter_ns()
+        if field_mocker.rowwise:
+            context = MockContext(index=index, updating=None, field_mocker=field_mocker)
+            for i, updating in enumerate(records, index):
+                context.index = i
+                context.updating = updating
+                field_mocker.mock(context, entity_mocker.entity)
+        else:
+            field_mocker.mock_batch(size, MockContext(index=index, updating=columns, field_mocker=field_mocker), entity_mocker.entity)
+        field_ns[field_mocker.get_name()] = (time.perf_counter_ns() - started_at) / size
+    return field_ns
+
+def run_case(case: Dict[str, Any]) -> Dict[str, Any]:
+    logger.remove()
+    logger.add(sys.stderr, level='WARNING')
+    with tempfile.TemporaryDirectory() as seeds_dir:
+        seeds_path = os.path.join(seeds_dir, 'seeds.txt')
+        with open(seeds_path, 'w') as f:
+            f.writelines(f'seed_{i}\n' for i in range(100000))
+
+        entity_spec = MockEntitySpec(
+            name=f'em_bench_{case["entity"]}',
+            implementation=sink_implementations[case['sink']],
+            fields=build_fields(case['entity'], seeds_path),
+            loadMode=case['load_mode'],
+            file={ 'path': os.path.join(seeds_dir, f'bench.{case["sink"]}') },
+            preview={ 'mode': 'off' }
+        )
+        entity_specs = { entity_spec.name: entity_spec }
+        entity_mocker = build_entity_mockers(entity_specs, build_entity_deps(entity_specs))[0]
+        entity = entity_mocker.entity
+        if case['sink'] == 'postgres':
+            create_table(entity)
+
+        try:
+            started_at = time.perf_counter()
+            entity_mocker.validate()
+            entity_mocker.prepare()
+            prepare_s = time.perf_counter() - started_at
+            generate_s, sink_s = 0.0, 0.0
+            records, records_start = [], 0
+            for start in range(0, case['records'], case['batch_size']):
+                stop = min(start + case['batch_size'], case['records'])
+                started_at = time.perf_counter()
+                records, records_start = entity_mocker.mock_records(start, stop), start
+                generated_at = time.perf_counter()
+                with entity.transaction():
+                    entity.insertall(records)
+                generate_s += generated_at - started_at
+                sink_s += time.perf_counter() - generated_at
+            # file sinks flush and close on finish
+            started_at = time.perf_counter()
+            entity_mocker.finish()
+            sink_s += time.perf_counter() - started_at
+            field_ns = time_fields(entity_mocker, records, records_start)
+        finally:
+            if case['sink'] == 'postgres':
+                drop_table(entity)
+                entity.connector.close()
+
+    total_s = prepare_s + generate_s + sink_s
+    return {
+        **case,
+        'rows_per_s': case['records'] / total_s,
+        'prepare_s': prepare_s,
+        'generate_s': generate_s,
+        'sink_s': sink_s,
+        # kilobytes on linux, bytes on macos
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024),
+        'field_ns_per_row': field_ns
+    }
+
+def main(**kwargs):
+    if kwargs['batch_size'] < 1 or min(kwargs['sizes']) < 1:
+        raise Exception(f'Bench sizes and batch size must be positive, sizes={kwargs["sizes"]}, batch_size={kwargs["batch_size"]}')
+    cases = [
+        { 'entity': entity, 'sink': sink, 'records': records, 'batch_size': kwargs['batch_size'], 'load_mode': kwargs['load_mode'] }
+        for entity in kwargs['entities'] for sink in kwargs['sinks'] for records in kwargs['sizes']
+    ]
+    baseline = {}
+    if kwargs['baseline']:
+        with open(kwargs['baseline']) as f:
+            baseline = { (result['entity'], result['sink'], result['records']): result for result in json.load(f)['results'] }
+
+    table = PrettyTable()
+    table.field_names = [ 'entity', 'sink', 'records', 'rows/s', 'change', 'generate s', 'sink s', 'peak rss mb', 'slowest field ns/row' ]
+    table.align = 'r'
+    results = []
+    # a fresh process per case, so peak rss and imports are not shared between cases
+    context = multiprocessing.get_context('spawn')
+    for case in cases:
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            result = pool.apply(run_case, (case,))
+        results.append(result)
+        previous = baseline.get((result['entity'], result['sink'], result['records']))
+        change = f'{100 * (result["rows_per_s"] / previous["rows_per_s"] - 1):+.1f}%' if previous else ''
+        slowest_field = max(result['field_ns_per_row'].items(), key=lambda item: item[1], default=('', 0))
+        table.add_row([ result['entity'], result['sink'], result['records'], f'{result["rows_per_s"]:,.0f}', change, f'{result["generate_s"]:.3f}', f'{result["sink_s"]:.3f}', f'{result["peak_rss_mb"]:.1f}', f'{slowest_field[0]} {slowest_field[1]:,.0f}' ])
+    print(table)
+
+    if kwargs['output']:
+        report = {
+            'created_at': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'results': results
+        }
+        with open(kwargs['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+
+parser = argparse.ArgumentParser(prog='em bench', description='Benchmark entity mockers and sinks')
+parser.add_argument('--entities', nargs='+', default=[ 'narrow', 'wide', 'seeded', 'custom' ], choices=[ 'narrow', 'wide', 'seeded', 'custom' ], help='Synthetic entities')
+parser.add_argument('--sinks', nargs='+', default=[ 'null', 'file' ], choices=list(sink_implementations.keys()), help='Sinks, postgres uses the POSTGRES_* settings and a scratch table')
+parser.add_argument('--sizes', nargs='+', type=int, default=[ 10000, 100000 ], help='Records per case')
+parser.add_argument('--batch_size', type=int, default=1000, help='Records per batch')
+parser.add_argument('--load_mode', type=LoadModeType, default=LoadModeType.INSERT, choices=list(LoadModeType), help='Postgres load mode')
+parser.add_argument('--output', type=str, default=None, help='JSON file the results are written to')
+parser.add_argument('--baseline', type=str, default=None, help='JSON file of a previous run to compare rows/s with')
@@ -0,0 +1,134 @@
+import graphlib
+from typing import List, Dict, Set
+
+from em.entity.seeders import (
+    FieldSeeder,
+    EntityFieldSeeder,
+    FileFieldSeeder
+)
+
+from em.entity.entities import (
+    MockEntity,
+    PostgresMockEntity,
+    PostgresSeedEntity
+)
+
+from em.entity.stores import PublishedSeedEntity
+
+from em.entity.mockers import (
+    FieldMocker,
+    CurrentDateTimeFieldMocker,
+    RandomDateTimeFieldMocker,
+    CustomFieldMocker,
+    RandomDecimalFieldMocker,
+    RandomIntFieldMocker,
+    ConstantFieldMocker,
+    RandomFieldMocker,
+    KeyFieldMocker,
+    EntityMocker
+)
+
+from em.utils.import_utils import load_class
+from em.utils.profile_utils import profiler
+
+from em.entity.specs import (
+    EntityFieldSeederSpec,
+    MockEntitySpec,
+    MockEntityFieldSpec
+)
+
+field_mocker_klasses: Dict[str, type[FieldMocker]] = {
+    'custom': CustomFieldMocker,
+    'constant': ConstantFieldMocker,
+    'random': RandomFieldMocker,
+    'random_int': RandomIntFieldMocker,
+    'random_decimal': RandomDecimalFieldMocker,
+    'current_datetime': CurrentDateTimeFieldMocker,
+    'random_datetime': RandomDateTimeFieldMocker
+}
+
+def build_entity_deps(entity_specs: Dict[str, MockEntitySpec]) -> Dict[str, Set[str]]:
+    return { entity_spec.name: { field_spec.seedsFromEntity.name for field_spec in entity_spec.fields if field_spec.seedsFromEntity } for entity_spec in entity_specs.values() }
+
+def build_entity_mockers(entity_specs: Dict[str, MockEntitySpec], entity_deps: Dict[str, Set[str]], entity_order: List[str] = None) -> List[EntityMocker]:
+    entity_impls: Dict[str, type[MockEntity]] = {}
+
+    # build entity mockers, in the given topological order when it is already known
+    if entity_order is None:
+        entity_order = graphlib.TopologicalSorter(entity_deps).static_order()
+    sorted_entity_specs = [ entity_specs[entity_name] for entity_name in entity_order if entity_name in entity_specs ]
+    entity_mockers: List[EntityMocker] = []
+    for entity_spec in sorted_entity_specs:
+        # build entity implementation
+        entity_impl_klass = load_class(entity_spec.implementation, MockEntity)
+        entity_impl = entity_impl_klass(entity_spec)
+
+        field_specs: Dict[str, MockEntityFieldSpec] = { field_spec.name: field_spec for field_spec in entity_spec.fields }
+
+        # build field deps
+        field_deps = { field_spec.name: set(field_spec.dependencies) for field_spec in entity_spec.fields }
+        field_top_sorter = graphlib.TopologicalSorter(field_deps)
+        sorted_field_specs = [ field_specs[field_name] for field_name in field_top_sorter.static_order() if field_name in field_specs ]
+
+        # build field mockers
+        field_mockers = []
+        for field_spec in sorted_field_specs:
+            seeder: type[FieldSeeder] = None
+
+            if field_spec.seedsFromEntity:
+                # build seed entity impl
+                seed_entity_name = field_spec.seedsFromEntity.name
+                seed_entity_impl = entity_impls.get(seed_entity_name)
+                if seed_entity_impl is None and issubclass(entity_impl_klass, PostgresMockEntity):
+                    seed_entity_impl = PostgresSeedEntity(field_spec.seedsFromEntity.name, entity_spec.schema)
+                    entity_impls[seed_entity_name] = seed_entity_impl
+                # values published by the seed entity in this run are read instead of its table
+                publish_spec = entity_specs[seed_entity_name].publish if seed_entity_name in entity_specs else None
+                if publish_spec and field_spec.seedsFromEntity.field in publish_spec.fields + publish_spec.returning:
+                    seed_entity_impl = PublishedSeedEntity(seed_entity_name, seed_entity_impl)
+                # build entity seeder
+                seeder = EntityFieldSeeder(field_spec.seedsFromEntity, seed_entity_impl)
+
+            if field_spec.seedsFromFile:
+                # build file seeder
+                seeder = FileFieldSeeder(field_spec.seedsFromFile)
+
+            field_mocker = field_mocker_klasses[field_spec.type](field_spec, seeder)
+            field_mockers.append(field_mocker)
+
+        # keys of existing rows are read from the table of the entity itself
+        key_mocker = None
+        update_spec = entity_spec.update
+        if update_spec and issubclass(entity_impl_klass, PostgresMockEntity):
+            key_seeder_spec = EntityFieldSeederSpec(name=entity_spec.name, field=update_spec.key, **update_spec.model_dump(include={ 'sample', 'sampleMethod', 'refreshInterval' }, exclude_none=True))
+            key_seeder = EntityFieldSeeder(key_seeder_spec, PostgresSeedEntity(entity_spec.name, entity_spec.schema))
+            key_mocker = KeyFieldMocker(MockEntityFieldSpec(name=update_spec.key, type='random', seedsFromEntity=key_seeder_spec), key_seeder)
+
+        entity_mocker = EntityMocker(entity_spec, entity_impl, field_mockers, key_mocker)
+        if profiler.enabled:
+            instrument_entity_mocker(entity_mocker)
+        entity_mockers.append(entity_mocker)
+    return entity_mockers
+
+def instrument_entity_mocker(entity_mocker: EntityMocker) -> None:
+    entity_name = entity_mocker.entity_spec.name
+    for field_mocker in entity_mocker.field_mockers:
+        name = f'{entity_name}.{field_mocker.get_name()}'
+        if field_mocker.rowwise:
+            profiler.instrument(field_mocker, 'mock', 'field', name, lambda args, result: 1)
+        else:
+            profiler.instrument(field_mocker, 'mock_batch', 'field', name, lambda args, result: args[0])
+        if field_mocker.seeder:
+            profiler.instrument(field_mocker.seeder, 'get_seeds', 'seeder', name, lambda args, result: len(result))
+    profiler.instrument(entity_mocker, 'mock_records', 'generate', entity_name, lambda args, result: len(result))
+    profiler.instrument(entity_mocker.entity, 'insertall', 'insert', entity_name, lambda args, result: len(args[0]))
+    # the default async methods call the sync ones from a thread, which are already measured
+    if type(entity_mocker.entity).insertall_async is not MockEntity.insertall_async:
+        profiler.instrument(entity_mocker.entity, 'insertall_async', 'insert', entity_name, lambda args, result: len(args[1]))
+    if entity_mocker.key_mocker:
+        profiler.instrument(entity_mocker.key_mocker.seeder, 'get_seeds', 'seeder', f'{entity_name}.{entity_mocker.key_mocker.get_name()}', lambda args, result: len(result))
+        profiler.instrument(entity_mocker.entity, 'updateall', 'update', entity_name, lambda args, result: len(args[0]))
+        if type(entity_mocker.entity).updateall_async is not MockEntity.updateall_async:
+            profiler.instrument(entity_mocker.entity, 'updateall_async', 'update', entity_name, lambda args, result: len(args[1]))
+    if entity_mocker.entity.preview:
+        profiler.instrument(entity_mocker.entity.preview, 'add', 'preview', entity_name, lambda args, result: len(args[1]))
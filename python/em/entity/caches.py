@@ -0,0 +1,134 @@
+from typing import Any, Dict, List, Sequence, Tuple
+from datetime import date, datetime
+from decimal import Decimal
+import tempfile
+import hashlib
+import pickle
+import json
+import os
+
+import numpy
+
+from environs import Env
+from loguru import logger
+
+env = Env()
+env.read_env()
+
+class CachedSeeds:
+    def __init__(self, values: Sequence[Any], fetched_at: float, watermark: Any = None) -> None:
+        self.values = values
+        # epoch seconds
+        self.fetched_at = fetched_at
+        self.watermark = watermark
+
+class SeedCache:
+    # seeds of entity fields kept on disk between runs, one npz file per key:
+    # numbers as typed arrays, strings as a utf-8 pool with offsets, anything else pickled,
+    # least recently used files are evicted above max_size bytes
+    instances: Dict[int, 'SeedCache'] = {}
+
+    def __init__(self) -> None:
+        self.directory = env.str('SEED_CACHE_DIR', default=os.path.join(tempfile.gettempdir(), 'em-seeds'))
+        self.max_size = env.int('SEED_CACHE_MAX_SIZE', default=1024 * 1024 * 1024)
+
+    @classmethod
+    def get_instance(cls) -> 'SeedCache':
+        pid = os.getpid()
+        if pid not in cls.instances:
+            cls.instances[pid] = cls()
+        return cls.instances[pid]
+
+    def get_path(self, key: Tuple[Any, ...]) -> str:
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f'{digest}.npz')
+
+    def load(self, key: Tuple[Any, ...]) -> CachedSeeds:
+        path = self.get_path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with numpy.load(path) as arrays:
+                meta = json.loads(str(arrays['meta']))
+                if meta['key'] != repr(key):
+                    return None
+                values = decode_values(meta['kind'], arrays)
+        except Exception as e:
+            logger.warning(f'Seed cache can not be read, path={path}, error={e}')
+            return None
+        # recently used files are evicted last
+        os.utime(path)
+        return CachedSeeds(values, meta['fetched_at'], decode_scalar(meta['watermark']))
+
+    def save(self, key: Tuple[Any, ...], cached_seeds: CachedSeeds) -> None:
+        path = self.get_path(key)
+        kind, arrays = encode_values(cached_seeds.values)
+        meta = { 'key': repr(key), 'kind': kind, 'fetched_at': cached_seeds.fetched_at, 'watermark': encode_scalar(cached_seeds.watermark) }
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(f'{path}.tmp', 'wb') as f:
+                numpy.savez(f, meta=numpy.array(json.dumps(meta)), **arrays)
+            os.replace(f'{path}.tmp', path)
+        except OSError as e:
+            logger.warning(f'Seed cache can not be saved, path={path}, error={e}')
+            return
+        self.evict(path)
+
+    def evict(self, kept_path: str) -> None:
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.npz') and path != kept_path:
+                stat = os.stat(path)
+                files.append((stat.st_mtime, stat.st_size, path))
+        size = sum(file_size for _, file_size, _ in files) + os.path.getsize(kept_path)
+        for _, file_size, path in sorted(files):
+            if size <= self.max_size:
+                break
+            logger.debug(f'Evict cached seeds, path={path}, size={file_size}')
+            os.remove(path)
+            size -= file_size
+
+def encode_values(values: Sequence[Any]) -> Tuple[str, Dict[str, numpy.ndarray]]:
+    if isinstance(values, numpy.ndarray) and values.dtype.kind in 'iuf':
+        return 'array', { 'values': values }
+    values = values.tolist() if isinstance(values, numpy.ndarray) else list(values)
+    if all(type(value) is str for value in values):
+        encoded = [ value.encode() for value in values ]
+        offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+        numpy.cumsum([ len(value) for value in encoded ], out=offsets[1:])
+        return 'str', { 'pool': numpy.frombuffer(b''.join(encoded), dtype=numpy.uint8), 'offsets': offsets }
+    return 'pickle', { 'pickle': numpy.frombuffer(pickle.dumps(values, protocol=pickle.HIGHEST_PROTOCOL), dtype=numpy.uint8) }
+
+def decode_values(kind: str, arrays: Any) -> Sequence[Any]:
+    if kind == 'array':
+        return arrays['values']
+    if kind == 'str':
+        pool = arrays['pool'].tobytes()
+        offsets = arrays['offsets'].tolist()
+        values = numpy.empty(len(offsets) - 1, dtype=object)
+        values[:] = [ pool[start:end].decode() for start, end in zip(offsets, offsets[1:]) ]
+        return values
+    return pickle.loads(arrays['pickle'].tobytes())
+
+def encode_scalar(value: Any) -> List[Any]:
+    # watermarks are ints, numbers, dates or timestamps
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return [ 'json', value ]
+    if isinstance(value, datetime):
+        return [ 'datetime', value.isoformat() ]
+    if isinstance(value, date):
+        return [ 'date', value.isoformat() ]
+    if isinstance(value, Decimal):
+        return [ 'decimal', str(value) ]
+    raise Exception(f'Watermark type is not supported, value={value}, type={type(value).__name__}')
+
+def decode_scalar(encoded: List[Any]) -> Any:
+    kind, value = encoded
+    if kind == 'datetime':
+        return datetime.fromisoformat(value)
+    if kind == 'date':
+        return date.fromisoformat(value)
+    if kind == 'decimal':
+        return Decimal(value)
+    return value
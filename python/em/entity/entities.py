@@ -1,17 +1,33 @@
 from abc import ABC, abstractmethod
-from typing import List, Any, Dict, Tuple, Iterable
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from typing import List, Any, AsyncIterator, Callable, ContextManager, Dict, Iterable, Tuple, Iterator, Sequence
+from dataclasses import dataclass
+from operator import itemgetter
 
 from em.entity.specs import (
-    MockEntitySpec
+    MockEntitySpec,
+    MockEntityFieldType,
+    LoadModeType,
+    SampleMethodType,
+    WriteModeType
 )
+from em.entity.previews import build_preview
+from em.utils.iter_utils import reservoir_sample
+from em.utils.profile_utils import profiler
 
-import psycopg
-from psycopg import Connection, sql
-from psycopg.abc import Query, Params
-from psycopg.rows import DictRow, dict_row
-from prettytable import PrettyTable
+from psycopg import AsyncConnection, Connection, sql
+from psycopg.abc import Query, Params, Buffer
+from psycopg.rows import DictRow, dict_row, tuple_row
+from psycopg.types.datetime import DatetimeBinaryDumper
+from psycopg_pool import ConnectionPool
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
 from environs import Env
-import shutil
+import threading
+import asyncio
+import os
+import re
 
 from loguru import logger
 
@@ -20,132 +36,671 @@ class SeedEntity(ABC):
         self.name = name
     
     @abstractmethod
-    def get_seeds(self, field: str) -> List[Any]:
+    def get_seeds(self, field: str, sample: int = None, sample_method: SampleMethodType = None, watermark: str = None, low: Any = None, high: Any = None) -> List[Any]:
         raise NotImplementedError()
+
+    def get_watermark(self, column: str) -> Any:
+        raise Exception(f'Watermark is not supported by the seed entity, entity={self.name}, column={column}')
+
+    def get_cache_key(self, field: str) -> Tuple[Any, ...]:
+        # seeds are only cached on disk when the source can be identified across runs
+        return None
     
 
 class PostgresSeedEntity(SeedEntity):
+    # sample more blocks than needed, DISTINCT and block sampling both shrink the result
+    tablesample_oversampling = 2
+
     def __init__(self, name: str, schema: str) -> None:
         super().__init__(name)
-        self.schema = schema
-        self.connector = PostgresConnector()
+        self.schema = schema if schema else 'public'
+        self.connector = PostgresConnector.get_instance()
+
+    def get_seeds(self, field: str, sample: int = None, sample_method: SampleMethodType = None, watermark: str = None, low: Any = None, high: Any = None) -> List[Any]:
+        # rows with a watermark in (low, high] only, when a watermark is given
+        table = sql.Identifier(self.schema, self.name)
+        with self.connector.create_session() as session:
+            if sample and sample_method == SampleMethodType.TABLESAMPLE:
+                # DISTINCT returns values in sort or hash order, a LIMIT would keep the lowest ones
+                query = sql.SQL('SELECT DISTINCT {column} FROM {table} TABLESAMPLE SYSTEM (%s)').format(
+                    column=sql.Identifier(field),
+                    table=table
+                )
+                rows = session.stream(query, (self.get_sample_percent(session, sample),))
+                return reservoir_sample(( row[0] for row in rows ), sample)
+
+            conditions, params = [], []
+            if watermark and low is not None:
+                conditions.append(sql.SQL('{watermark} > %s').format(watermark=sql.Identifier(watermark)))
+                params.append(low)
+            if watermark and high is not None:
+                conditions.append(sql.SQL('{watermark} <= %s').format(watermark=sql.Identifier(watermark)))
+                params.append(high)
+            query = sql.SQL('SELECT DISTINCT {column} FROM {table}{where}').format(
+                column=sql.Identifier(field),
+                table=table,
+                where=sql.SQL(' WHERE ') + sql.SQL(' AND ').join(conditions) if conditions else sql.SQL('')
+            )
+            values = ( row[0] for row in session.stream(query, params if params else None) )
+            return reservoir_sample(values, sample) if sample else list(values)
 
-    def get_seeds(self, field: str) -> List[Any]:
-        query = sql.SQL('SELECT DISTINCT {column} FROM {table}').format(
-            column=sql.Identifier(field),
+    def get_watermark(self, column: str) -> Any:
+        query = sql.SQL('SELECT max({column}) AS watermark FROM {table}').format(
+            column=sql.Identifier(column),
             table=sql.Identifier(self.schema, self.name)
         )
         with self.connector.create_session() as session:
-            rows = session.fetchall(query)
-        return [ row[field] for row in rows ]
+            return session.fetchall(query)[0]['watermark']
+
+    def get_cache_key(self, field: str) -> Tuple[Any, ...]:
+        return ('postgres', self.connector.host, self.connector.port, self.connector.database, self.schema, self.name, field)
+
+    def get_sample_percent(self, session: 'PostgresSession', sample: int) -> float:
+        query = sql.SQL('SELECT reltuples FROM pg_class WHERE oid = %s::regclass')
+        rows = session.fetchall(query, (sql.Identifier(self.schema, self.name).as_string(session.conn),))
+        # reltuples is negative or zero until the table is analyzed
+        estimated_rows = rows[0]['reltuples'] if rows else 0
+        if estimated_rows <= sample:
+            return 100.0
+        return min(100.0, 100.0 * sample * self.tablesample_oversampling / estimated_rows)
     
 class MockEntity(ABC):
+    # columns can be returned by the sink on insert
+    supports_returning = False
+    # records can be written to existing rows, see updateall
+    supports_updates = False
+
     def __init__(self, spec: MockEntitySpec) -> None:
         self.spec = spec
+        self.preview = build_preview(spec.preview, spec.name)
     
     @abstractmethod
     def load_records(self) -> None:
         raise NotImplementedError()
+
+    def validate(self, write_mode: WriteModeType = WriteModeType.INSERT) -> None:
+        # called once before any record is generated, raises when the spec does not fit the sink
+        pass
     
     @abstractmethod
-    def insertall(self) -> None:
+    def insertall(self, records: List[Dict[str, Any]], load_mode: LoadModeType = None) -> List[Dict[str, Any]]:
+        # returns the rows of the returning columns of the publish spec, if any
         raise NotImplementedError()
-    
+
+    def updateall(self, records: List[Dict[str, Any]], write_mode: WriteModeType, load_mode: LoadModeType = None) -> None:
+        # writes records to the rows with the same key, upserted records without one are inserted
+        raise NotImplementedError()
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        # insertall calls made inside are committed together
+        yield
+
+    @asynccontextmanager
+    async def async_session(self) -> AsyncIterator[Any]:
+        # one per writer of a concurrent pipeline, passed to insertall_async
+        yield None
+
+    async def insertall_async(self, session: Any, records: List[Dict[str, Any]], load_mode: LoadModeType = None) -> List[Dict[str, Any]]:
+        # entities without an async client write from a thread
+        def insertall() -> List[Dict[str, Any]]:
+            with self.transaction():
+                return self.insertall(records, load_mode=load_mode) if load_mode else self.insertall(records)
+        return await asyncio.get_running_loop().run_in_executor(None, insertall)
+
+    async def updateall_async(self, session: Any, records: List[Dict[str, Any]], write_mode: WriteModeType, load_mode: LoadModeType = None) -> None:
+        def updateall() -> None:
+            with self.transaction():
+                self.updateall(records, write_mode, load_mode)
+        await asyncio.get_running_loop().run_in_executor(None, updateall)
+
+    def finish(self) -> None:
+        # called once all records of an entity run are written
+        if self.preview:
+            self.preview.finish()
+
+class LocalDatetimeBinaryDumper(DatetimeBinaryDumper):
+    def dump(self, obj: datetime) -> Buffer:
+        # naive datetimes are read in the session timezone, same as an INSERT would do
+        if not obj.tzinfo:
+            obj = obj.replace(tzinfo=self.connection.info.timezone)
+        return super().dump(obj)
+
+def get_statement_name(query: str) -> str:
+    # placeholder lists of any length are one statement, so VALUES chunks share a metric
+    query = re.sub(r'\((?:%s(?:::[^,()]+)?,?)+\)', '(...)', query)
+    return re.sub(r'\(\.\.\.\)(?:,\(\.\.\.\))+', '(...)', query)
+
 class PostgresSession:
-    def __init__(self, conn: Connection) -> None:
+    def __init__(self, conn: Connection, pool: ConnectionPool = None, shared: bool = False) -> None:
         self.conn = conn
+        self.pool = pool
+        # shared sessions join a transaction opened by an outer session
+        self.shared = shared
     
-    def insertmany(self, query: Query, params_seq: Iterable[Params]):
+    def measure(self, query: Query, rows: int = 0) -> ContextManager[None]:
+        if not profiler.enabled:
+            return nullcontext()
+        return profiler.measure('statement', get_statement_name(query.as_string(self.conn)), rows)
+
+    def execute(self, query: Query, params: Params = None):
+        logger.debug(f'Execute {query.as_string(self.conn)}, params={params}')
+        with self.measure(query):
+            self.conn.execute(query, params)
+
+    def insertmany(self, query: Query, params_seq: Sequence[Params], returning: bool = False) -> List[DictRow]:
         logger.debug(f'Execute {query.as_string(self.conn)}, values={params_seq}')
-        with self.conn.cursor() as cur:
-            cur.executemany(query, params_seq)
+        with self.measure(query, len(params_seq)), self.conn.cursor() as cur:
+            cur.executemany(query, params_seq, returning=returning)
+            if not returning:
+                return None
+            # one result per executed row
+            rows = []
+            while True:
+                rows.extend(cur.fetchall())
+                if not cur.nextset():
+                    return rows
 
-    def fetchall(self, query: Query) -> DictRow:
-        logger.debug(f'Execute {query.as_string(self.conn)}')
-        with self.conn.execute(query) as cur:
+    def copy(self, query: Query, rows: Sequence[Sequence[Any]], types: List[int] = None):
+        logger.debug(f'Execute {query.as_string(self.conn)}, types={types}')
+        with self.measure(query, len(rows)), self.conn.cursor() as cur:
+            cur.adapters.register_dumper(datetime, LocalDatetimeBinaryDumper)
+            with cur.copy(query) as copy:
+                if types:
+                    copy.set_types(types)
+                for row in rows:
+                    copy.write_row(row)
+
+    def stream(self, query: Query, params: Params = None, size: int = 10000) -> Iterator[Tuple[Any]]:
+        # server-side cursor, rows are fetched size at a time, fetches are measured by the seeder
+        logger.debug(f'Execute {query.as_string(self.conn)}, params={params}')
+        with self.conn.cursor(name='em_stream', row_factory=tuple_row) as cur:
+            cur.itersize = size
+            with self.measure(query):
+                cur.execute(query, params)
+            yield from cur
+
+    def fetchall(self, query: Query, params: Params = None) -> DictRow:
+        logger.debug(f'Execute {query.as_string(self.conn)}, params={params}')
+        with self.measure(query), self.conn.execute(query, params) as cur:
             return cur.fetchall()
         
     def __enter__(self):
         return self
     
     def __exit__(self, exc_type, exc_value, traceback):
-        if self.conn:
-            self.conn.commit()
-            self.conn.close()
+        if self.conn and not self.shared:
+            if exc_type:
+                self.conn.rollback()
+            else:
+                self.conn.commit()
+            if self.pool:
+                self.pool.putconn(self.conn)
+            else:
+                self.conn.close()
+
+class AsyncPostgresSession:
+    # a connection of its own per writer, committed by the caller
+    def __init__(self, conn: AsyncConnection) -> None:
+        self.conn = conn
+
+    def measure(self, query: Query, rows: int = 0) -> ContextManager[None]:
+        if not profiler.enabled:
+            return nullcontext()
+        return profiler.measure('statement', get_statement_name(query.as_string(self.conn)), rows)
+
+    async def execute(self, query: Query, params: Params = None):
+        logger.debug(f'Execute {query.as_string(self.conn)}, params={params}')
+        with self.measure(query):
+            await self.conn.execute(query, params)
+
+    async def insertmany(self, query: Query, params_seq: Sequence[Params], returning: bool = False) -> List[DictRow]:
+        logger.debug(f'Execute {query.as_string(self.conn)}, values={params_seq}')
+        with self.measure(query, len(params_seq)):
+            async with self.conn.cursor() as cur:
+                await cur.executemany(query, params_seq, returning=returning)
+                if not returning:
+                    return None
+                rows = []
+                while True:
+                    rows.extend(await cur.fetchall())
+                    if not cur.nextset():
+                        return rows
+
+    async def copy(self, query: Query, rows: Sequence[Sequence[Any]], types: List[int] = None):
+        logger.debug(f'Execute {query.as_string(self.conn)}, types={types}')
+        with self.measure(query, len(rows)):
+            async with self.conn.cursor() as cur:
+                cur.adapters.register_dumper(datetime, LocalDatetimeBinaryDumper)
+                async with cur.copy(query) as copy:
+                    if types:
+                        copy.set_types(types)
+                    for row in rows:
+                        await copy.write_row(row)
+
+    async def fetchall(self, query: Query, params: Params = None) -> DictRow:
+        logger.debug(f'Execute {query.as_string(self.conn)}, params={params}')
+        with self.measure(query):
+            cur = await self.conn.execute(query, params)
+            return await cur.fetchall()
 
 env = Env()
 env.read_env()
 
 class PostgresConnector:
+    instances: Dict[int, 'PostgresConnector'] = {}
+
     def __init__(self) -> None:
         self.host = env.str('POSTGRES_HOST', default='localhost')
         self.port = env.int('POSTGRES_PORT', default=5432)
         self.database = env.str('POSTGRES_DATABASE', default='postgres')
         self.user = env.str('POSTGRES_USER', default='postgres')
         self.password = env.str('POSTGRES_PASSWORD', default=None)
+        self.pool_min_size = env.int('POSTGRES_POOL_MIN_SIZE', default=1)
+        self.pool_max_size = env.int('POSTGRES_POOL_MAX_SIZE', default=4)
+        self.pool: ConnectionPool = None
+        # transactions are pinned per thread, threads loading in parallel get their own connections
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'PostgresConnector':
+        # one connector per process, pooled connections must not cross a fork
+        pid = os.getpid()
+        if pid not in cls.instances:
+            cls.instances[pid] = cls()
+        return cls.instances[pid]
+
+    def get_uri(self) -> str:
+        return f'postgresql://{self.user}:{self.password}@{self.host}:{self.port}/{self.database}'
+
+    def get_pool(self) -> ConnectionPool:
+        with self.lock:
+            if self.pool is None:
+                logger.debug(f'Open connection pool, host={self.host}, min_size={self.pool_min_size}, max_size={self.pool_max_size}')
+                self.pool = ConnectionPool(self.get_uri(), min_size=self.pool_min_size, max_size=self.pool_max_size, kwargs={'row_factory': dict_row}, open=True)
+        return self.pool
+
+    async def connect_async(self) -> AsyncConnection:
+        # async connections are bound to the event loop of a pipeline, so they are not pooled
+        logger.debug(f'Open async connection, host={self.host}')
+        return await AsyncConnection.connect(self.get_uri(), row_factory=dict_row)
 
     def create_session(self) -> PostgresSession:
-        uri = f'postgresql://{self.user}:{self.password}@{self.host}:{self.port}/{self.database}'
-        conn = psycopg.connect(uri, row_factory=dict_row)
-        return PostgresSession(conn)
+        pinned_session: PostgresSession = getattr(self.local, 'session', None)
+        if pinned_session:
+            return PostgresSession(pinned_session.conn, shared=True)
+        pool = self.get_pool()
+        return PostgresSession(pool.getconn(), pool)
+
+    @contextmanager
+    def transaction(self) -> Iterator[PostgresSession]:
+        # sessions created inside share one transaction, committed when the outermost one exits
+        with self.create_session() as session:
+            if session.shared:
+                yield session
+                return
+            self.local.session = session
+            try:
+                yield session
+            finally:
+                self.local.session = None
+
+    def reserve(self, size: int) -> None:
+        # threads loading in parallel each hold a connection for a batch or a whole shard
+        with self.lock:
+            if size <= self.pool_max_size:
+                return
+            logger.info(f'Grow connection pool to the loader threads, max_size={size}, configured_max_size={self.pool_max_size}')
+            self.pool_max_size = size
+            if self.pool:
+                self.pool.resize(self.pool_min_size, self.pool_max_size)
+
+    def close(self) -> None:
+        with self.lock:
+            if self.pool:
+                self.pool.close()
+                self.pool = None
+
+@dataclass
+class TableColumn:
+    __slots__ = ('name', 'type_oid', 'type_name', 'sql_type', 'not_null', 'has_default')
+    name: str
+    # base type of domains, values are dumped and checked as the base type
+    type_oid: int
+    type_name: str
+    # format_type of the declared type, for casts
+    sql_type: str
+    not_null: bool
+    # defaults, identity and generated columns
+    has_default: bool
 
 class PostgresMockEntity(MockEntity):
+    supports_returning = True
+    supports_updates = True
+    # bind parameters of a statement
+    max_params = 65535
+    # pg_type.typname of the base type of the columns each field type can be written to, any column otherwise
+    field_column_types = {
+        MockEntityFieldType.random_int: { 'int2', 'int4', 'int8', 'numeric', 'float4', 'float8' },
+        MockEntityFieldType.random_decimal: { 'numeric', 'float4', 'float8' },
+        MockEntityFieldType.current_datetime: { 'timestamp', 'timestamptz' },
+        MockEntityFieldType.random_datetime: { 'timestamp', 'timestamptz' }
+    }
+    # python types the binary dumper of each base type accepts, other columns are copied in text format
+    binary_copy_types = {
+        'int2': { int },
+        'int4': { int },
+        'int8': { int },
+        'numeric': { int, Decimal },
+        'float4': { int, float, Decimal },
+        'float8': { int, float, Decimal },
+        'text': { str },
+        'varchar': { str },
+        'bool': { bool },
+        'date': { date },
+        # naive values of timestamptz columns are read in the session timezone
+        'timestamp': { datetime },
+        'timestamptz': { datetime },
+        'uuid': { UUID },
+        'bytea': { bytes }
+    }
+    # other column types can not be classified, fields written to them are only checked by postgres
+    known_column_types = { 'int2', 'int4', 'int8', 'numeric', 'float4', 'float8', 'timestamp', 'timestamptz', 'date', 'time', 'timetz', 'interval', 'bool', 'text', 'varchar', 'bpchar', 'uuid', 'bytea', 'json', 'jsonb' }
+
     def __init__(self, spec: MockEntitySpec) -> None:
         super().__init__(spec)
-        self.connector = PostgresConnector()
+        self.connector = PostgresConnector.get_instance()
+        self.table_columns: Dict[str, TableColumn] = None
+        # fixed on the first batch, in table order
+        self.columns: List[str] = None
+        self.get_row: Callable[[Dict[str, Any]], Tuple[Any]] = None
+        self.lock = threading.Lock()
 
     def load_records(self) -> None:
         pass
 
+    def validate(self, write_mode: WriteModeType = WriteModeType.INSERT) -> None:
+        with self.connector.create_session() as session:
+            self.load_table_columns(session)
+        table_columns = self.table_columns
+
+        if not table_columns:
+            raise Exception(f'Table must exist, entity={self.spec.name}, table={self.get_schema()}.{self.spec.name}')
+        unknown_fields = [ field_spec.name for field_spec in self.spec.fields if field_spec.name not in table_columns ]
+        if unknown_fields:
+            raise Exception(f'Fields must be columns of the table, entity={self.spec.name}, fields={unknown_fields}, columns={list(table_columns.keys())}')
+        for field_spec in self.spec.fields:
+            table_column = table_columns[field_spec.name]
+            column_types = self.field_column_types.get(field_spec.type)
+            if column_types and table_column.type_name not in column_types and table_column.type_name not in self.known_column_types:
+                logger.warning(f'Field type can not be checked against the column type, entity={self.spec.name}, field={field_spec.name}, type={field_spec.type.value}, column_type={table_column.type_name}')
+            elif column_types and table_column.type_name not in column_types:
+                raise Exception(f'Field type does not fit the column type, entity={self.spec.name}, field={field_spec.name}, type={field_spec.type.value}, column_type={table_column.type_name}, column_types={sorted(column_types)}')
+            if field_spec.nullable and table_column.not_null:
+                raise Exception(f'Nullable field must not be written to a not null column, entity={self.spec.name}, field={field_spec.name}')
+
+        # the returned columns are usually filled by defaults
+        field_names = { field_spec.name for field_spec in self.spec.fields } | set(self.get_returning())
+        missing_columns = [ table_column.name for table_column in table_columns.values() if table_column.not_null and not table_column.has_default and table_column.name not in field_names ]
+        # updated rows keep the columns that are not written
+        if missing_columns and write_mode != WriteModeType.UPDATE:
+            raise Exception(f'Not null columns without default must be fields, entity={self.spec.name}, columns={missing_columns}')
+        unknown_columns = [ column for column in self.get_returning() if column not in table_columns ]
+        if unknown_columns:
+            raise Exception(f'Returning columns must be columns of the table, entity={self.spec.name}, columns={unknown_columns}')
+        if self.spec.update and self.spec.update.key not in table_columns:
+            raise Exception(f'Update key must be a column of the table, entity={self.spec.name}, key={self.spec.update.key}')
+
     def get_schema(self) -> str:
         return self.spec.schema if self.spec.schema else 'public'
 
-    def insertall(self, records: List[Dict[str, Any]]) -> None:
-        all_values = []
-        for record in records:
-            columns, values = zip(*record.items())
-            all_values.append(values)
-        
-        self.print_table(columns, all_values)
+    def get_table(self) -> sql.Identifier:
+        return sql.Identifier(self.get_schema(), self.spec.name)
 
-        query = sql.SQL('INSERT INTO {table} ({columns}) VALUES ({placeholders})').format(
-            table=sql.Identifier(self.get_schema(), self.spec.name),
-            columns=sql.SQL(',').join(map(sql.Identifier, columns)),
-            placeholders=sql.SQL(',').join(sql.Placeholder() * len(columns))
-        )
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        with self.connector.transaction():
+            yield
+
+    def insertall(self, records: List[Dict[str, Any]], load_mode: LoadModeType = None) -> List[Dict[str, Any]]:
+        returning = self.get_returning()
+
+        load_mode = load_mode if load_mode else self.spec.loadMode
+        with self.connector.create_session() as session:
+            self.load_table_columns(session)
+            columns, all_values = self.get_values(records)
+            if load_mode == LoadModeType.COPY and returning:
+                # copy does not return rows, records are copied to a staging table then inserted from it
+                session.execute(self.get_staging_query(columns))
+                self.copyall(session, columns, all_values, self.get_staging_table())
+                return session.fetchall(self.get_insert_staged_query(columns, returning))
+            elif load_mode == LoadModeType.COPY:
+                self.copyall(session, columns, all_values)
+            else:
+                return session.insertmany(self.get_insert_query(columns, returning), all_values, returning=bool(returning))
+
+    def updateall(self, records: List[Dict[str, Any]], write_mode: WriteModeType, load_mode: LoadModeType = None) -> None:
+        load_mode = load_mode if load_mode else self.spec.loadMode
         with self.connector.create_session() as session:
-            session.insertmany(query, all_values)
+            self.load_table_columns(session)
+            columns, all_values = self.get_values(records)
+            if load_mode == LoadModeType.COPY:
+                # records are copied to a staging table, then merged into the table by one statement
+                session.execute(self.get_staging_query(columns))
+                self.copyall(session, columns, all_values, self.get_staging_table())
+                session.execute(self.get_merge_query(columns, write_mode))
+                session.execute(self.get_truncate_staging_query())
+            elif write_mode == WriteModeType.UPSERT:
+                session.insertmany(self.get_upsert_query(columns), all_values)
+            else:
+                for query, params in self.get_update_statements(columns, all_values):
+                    session.execute(query, params)
 
-    def print_table(self, columns: List[str], rows: List[Tuple[Any]]):
-        screen_width = shutil.get_terminal_size().columns
+    @asynccontextmanager
+    async def async_session(self) -> AsyncIterator[AsyncPostgresSession]:
+        async with await self.connector.connect_async() as conn:
+            yield AsyncPostgresSession(conn)
 
-        cells = [ columns ] + [ list(map(str, row)) for row in rows ]
-        max_column_widths = [ max(len(cell) + 10 for cell in column_cells) for column_cells in zip(*cells)] 
+    async def insertall_async(self, session: AsyncPostgresSession, records: List[Dict[str, Any]], load_mode: LoadModeType = None) -> List[Dict[str, Any]]:
+        returning = self.get_returning()
 
-        current_width = 0
-        current_indices = []
-        subtables = []
+        load_mode = load_mode if load_mode else self.spec.loadMode
+        async with session.conn.transaction():
+            if self.table_columns is None:
+                rows = await session.fetchall(self.get_table_columns_query(), (self.get_table().as_string(session.conn),))
+                self.set_table_columns(rows)
+            columns, all_values = self.get_values(records)
+            if load_mode == LoadModeType.COPY:
+                if not returning:
+                    await self.copyall_async(session, columns, all_values)
+                    return None
+                await session.execute(self.get_staging_query(columns))
+                await self.copyall_async(session, columns, all_values, self.get_staging_table())
+                return await session.fetchall(self.get_insert_staged_query(columns, returning))
+            return await session.insertmany(self.get_insert_query(columns, returning), all_values, returning=bool(returning))
 
-        for i, max_column_width in enumerate(max_column_widths):
-            if current_width + max_column_width < screen_width:
-                current_width += max_column_width
-                current_indices.append(i)
+    async def updateall_async(self, session: AsyncPostgresSession, records: List[Dict[str, Any]], write_mode: WriteModeType, load_mode: LoadModeType = None) -> None:
+        load_mode = load_mode if load_mode else self.spec.loadMode
+        async with session.conn.transaction():
+            if self.table_columns is None:
+                rows = await session.fetchall(self.get_table_columns_query(), (self.get_table().as_string(session.conn),))
+                self.set_table_columns(rows)
+            columns, all_values = self.get_values(records)
+            if load_mode == LoadModeType.COPY:
+                await session.execute(self.get_staging_query(columns))
+                await self.copyall_async(session, columns, all_values, self.get_staging_table())
+                await session.execute(self.get_merge_query(columns, write_mode))
+                await session.execute(self.get_truncate_staging_query())
+            elif write_mode == WriteModeType.UPSERT:
+                await session.insertmany(self.get_upsert_query(columns), all_values)
             else:
-                subtables.append(current_indices)
-                current_width = max_column_width
-                current_indices = [i]
-
-        if current_indices:
-            subtables.append(current_indices)
-
-        for indices in subtables:
-            subcolumns = [ columns[i] for i in indices ]
-            subvalues = [ tuple(row[i] for i in indices) for row in rows ]
-
-            table = PrettyTable()
-            table.title = self.spec.name
-            table.field_names = subcolumns
-            table.align = 'r'
-            table.add_rows(subvalues)
-            print(table)
-            print()
+                for query, params in self.get_update_statements(columns, all_values):
+                    await session.execute(query, params)
+
+    def get_values(self, records: List[Dict[str, Any]]) -> Tuple[Sequence[str], List[Tuple[Any]]]:
+        if self.columns is None:
+            self.set_columns(records[0].keys())
+        all_values = list(map(self.get_row, records))
+
+        if self.preview:
+            self.preview.add(self.columns, all_values)
+        return self.columns, all_values
+
+    def set_columns(self, fields: Iterable[str]) -> None:
+        # records of an entity all have the same fields, values are read in table order without a lookup per field
+        with self.lock:
+            if self.columns is not None:
+                return
+            fields = list(fields)
+            columns = [ column for column in self.table_columns if column in fields ] if self.table_columns else fields
+            columns += [ field for field in fields if field not in columns ]
+            self.get_row = itemgetter(*columns) if len(columns) > 1 else lambda record: (record[columns[0]],)
+            self.columns = columns
+
+    def get_returning(self) -> List[str]:
+        return self.spec.publish.returning if self.spec.publish else []
+
+    def get_insert_query(self, columns: Sequence[str], returning: Sequence[str] = None) -> sql.Composed:
+        return sql.SQL('INSERT INTO {table} ({columns}) VALUES ({placeholders}){returning}').format(
+            table=self.get_table(),
+            columns=sql.SQL(',').join(map(sql.Identifier, columns)),
+            placeholders=sql.SQL(',').join(sql.Placeholder() * len(columns)),
+            returning=self.get_returning_clause(returning)
+        )
+
+    def get_returning_clause(self, returning: Sequence[str]) -> sql.Composable:
+        if not returning:
+            return sql.SQL('')
+        return sql.SQL(' RETURNING {columns}').format(columns=sql.SQL(',').join(map(sql.Identifier, returning)))
+
+    def get_staging_table(self) -> sql.Identifier:
+        return sql.Identifier(f'em_staging_{self.spec.name}')
+
+    def get_staging_query(self, columns: Sequence[str]) -> sql.Composed:
+        # a temporary table with the copied columns only, emptied by the insert from it
+        return sql.SQL('CREATE TEMPORARY TABLE IF NOT EXISTS {staging} ON COMMIT DROP AS SELECT {columns} FROM {table} WITH NO DATA').format(
+            staging=self.get_staging_table(),
+            columns=sql.SQL(',').join(map(sql.Identifier, columns)),
+            table=self.get_table()
+        )
+
+    def get_insert_staged_query(self, columns: Sequence[str], returning: Sequence[str]) -> sql.Composed:
+        return sql.SQL('WITH staged AS (DELETE FROM {staging} RETURNING {columns}) INSERT INTO {table} ({columns}) SELECT {columns} FROM staged{returning}').format(
+            staging=self.get_staging_table(),
+            columns=sql.SQL(',').join(map(sql.Identifier, columns)),
+            table=self.get_table(),
+            returning=self.get_returning_clause(returning)
+        )
+
+    def get_updated_columns(self, columns: Sequence[str]) -> List[str]:
+        key = self.spec.update.key
+        fields = self.spec.update.fields if self.spec.update.fields else columns
+        return [ column for column in columns if column in fields and column != key ]
+
+    def get_update_statements(self, columns: Sequence[str], all_values: List[Tuple[Any]]) -> Iterator[Tuple[sql.Composed, List[Any]]]:
+        # UPDATE ... FROM (VALUES ...) per chunk of rows, values are cast to the column types
+        key = self.spec.update.key
+        updated_columns = [ key ] + self.get_updated_columns(columns)
+        indices = [ columns.index(column) for column in updated_columns ]
+        placeholders = sql.SQL('({})').format(sql.SQL(',').join(sql.SQL('%s::' + self.table_columns[column].sql_type) for column in updated_columns))
+        chunk_size = self.max_params // len(updated_columns)
+        for start in range(0, len(all_values), chunk_size):
+            chunk = all_values[start:start + chunk_size]
+            query = sql.SQL('UPDATE {table} AS t SET {sets} FROM (VALUES {rows}) AS v ({columns}) WHERE t.{key} = v.{key}').format(
+                table=self.get_table(),
+                sets=sql.SQL(',').join(sql.SQL('{column} = v.{column}').format(column=sql.Identifier(column)) for column in updated_columns[1:]),
+                rows=sql.SQL(',').join([ placeholders ] * len(chunk)),
+                columns=sql.SQL(',').join(map(sql.Identifier, updated_columns)),
+                key=sql.Identifier(key)
+            )
+            yield query, [ values[i] for values in chunk for i in indices ]
+
+    def get_upsert_query(self, columns: Sequence[str]) -> sql.Composed:
+        # needs a unique index on the key
+        updated_columns = self.get_updated_columns(columns)
+        action = sql.SQL('DO UPDATE SET {sets}').format(
+            sets=sql.SQL(',').join(sql.SQL('{column} = EXCLUDED.{column}').format(column=sql.Identifier(column)) for column in updated_columns)
+        ) if updated_columns else sql.SQL('DO NOTHING')
+        return sql.SQL('{insert} ON CONFLICT ({key}) {action}').format(
+            insert=self.get_insert_query(columns),
+            key=sql.Identifier(self.spec.update.key),
+            action=action
+        )
+
+    def get_merge_query(self, columns: Sequence[str], write_mode: WriteModeType) -> sql.Composed:
+        # a key is written once per batch, MERGE and UPDATE can not write a row twice
+        key = sql.Identifier(self.spec.update.key)
+        updated_columns = self.get_updated_columns(columns)
+        staged = sql.SQL('(SELECT DISTINCT ON ({key}) {columns} FROM {staging}) AS s').format(
+            key=key,
+            columns=sql.SQL(',').join(map(sql.Identifier, columns)),
+            staging=self.get_staging_table()
+        )
+        sets = sql.SQL(',').join(sql.SQL('{column} = s.{column}').format(column=sql.Identifier(column)) for column in updated_columns)
+        if write_mode == WriteModeType.UPDATE:
+            return sql.SQL('UPDATE {table} AS t SET {sets} FROM {staged} WHERE t.{key} = s.{key}').format(table=self.get_table(), sets=sets, staged=staged, key=key)
+        # postgres 15 or later
+        return sql.SQL('MERGE INTO {table} AS t USING {staged} ON t.{key} = s.{key} {matched} WHEN NOT MATCHED THEN INSERT ({columns}) VALUES ({values})').format(
+            table=self.get_table(),
+            staged=staged,
+            key=key,
+            matched=sql.SQL('WHEN MATCHED THEN UPDATE SET {sets}').format(sets=sets) if updated_columns else sql.SQL('WHEN MATCHED THEN DO NOTHING'),
+            columns=sql.SQL(',').join(map(sql.Identifier, columns)),
+            values=sql.SQL(',').join(sql.SQL('s.{column}').format(column=sql.Identifier(column)) for column in columns)
+        )
+
+    def get_truncate_staging_query(self) -> sql.Composed:
+        return sql.SQL('TRUNCATE {staging}').format(staging=self.get_staging_table())
+
+    def copyall(self, session: PostgresSession, columns: Sequence[str], rows: List[Tuple[Any]], table: sql.Identifier = None) -> None:
+        types = self.get_copy_types(columns, rows)
+        session.copy(self.get_copy_query(columns, types, table), rows, types)
+
+    async def copyall_async(self, session: AsyncPostgresSession, columns: Sequence[str], rows: List[Tuple[Any]], table: sql.Identifier = None) -> None:
+        types = self.get_copy_types(columns, rows)
+        await session.copy(self.get_copy_query(columns, types, table), rows, types)
+
+    def get_copy_types(self, columns: Sequence[str], rows: List[Tuple[Any]]) -> List[int]:
+        # binary dumpers are built once per copy from the column types instead of per value,
+        # None for text format when a column has no binary dumper (enums, extension types)
+        # or values its dumper rejects, which the server casts like an INSERT
+        unknown_columns = [ column for column in columns if column not in self.table_columns ]
+        if unknown_columns:
+            raise Exception(f'Fields must be columns of the table, entity={self.spec.name}, fields={unknown_columns}')
+        for column, values in zip(columns, zip(*rows)):
+            table_column = self.table_columns[column]
+            value_types = set(map(type, values)) - { type(None) }
+            if not value_types <= self.binary_copy_types.get(table_column.type_name, set()) or (table_column.type_name == 'timestamp' and self.has_timezone(values)):
+                logger.debug(f'Copy {self.spec.name} in text format, column={column}, type={table_column.type_name}, value_types={sorted(value_type.__name__ for value_type in value_types)}')
+                return None
+        return [ self.table_columns[column].type_oid for column in columns ]
+
+    def has_timezone(self, values: Sequence[Any]) -> bool:
+        # values of a field are all naive or all aware
+        value = next(( value for value in values if value is not None ), None)
+        return isinstance(value, datetime) and value.tzinfo is not None
+
+    def get_copy_query(self, columns: Sequence[str], types: List[int], table: sql.Identifier = None) -> sql.Composed:
+        return sql.SQL('COPY {table} ({columns}) FROM STDIN{options}').format(
+            table=table if table else self.get_table(),
+            columns=sql.SQL(',').join(map(sql.Identifier, columns)),
+            options=sql.SQL(' (FORMAT BINARY)' if types else '')
+        )
+
+    def get_table_columns_query(self) -> sql.SQL:
+        return sql.SQL(
+            'SELECT a.attname, t.oid AS atttypid, t.typname, format_type(a.atttypid, NULL) AS sqltype, a.attnotnull OR d.typnotnull AS attnotnull, '
+            "a.atthasdef OR a.attidentity <> '' OR a.attgenerated <> '' AS hasdefault "
+            'FROM pg_attribute a JOIN pg_type d ON d.oid = a.atttypid JOIN pg_type t ON t.oid = COALESCE(NULLIF(d.typbasetype, 0), a.atttypid) '
+            'WHERE a.attrelid = to_regclass(%s) AND a.attnum > 0 AND NOT a.attisdropped ORDER BY a.attnum'
+        )
+
+    def load_table_columns(self, session: PostgresSession) -> Dict[str, TableColumn]:
+        # the table is introspected once, an empty dict when it does not exist
+        if self.table_columns is None:
+            self.set_table_columns(session.fetchall(self.get_table_columns_query(), (self.get_table().as_string(session.conn),)))
+        return self.table_columns
+
+    def set_table_columns(self, rows: List[DictRow]) -> None:
+        self.table_columns = { row['attname']: TableColumn(row['attname'], row['atttypid'], row['typname'], row['sqltype'], row['attnotnull'], row['hasdefault']) for row in rows }
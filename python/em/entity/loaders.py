@@ -0,0 +1,123 @@
+import graphlib
+import hashlib
+import pickle
+import os
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+import yaml
+
+from em.entity import specs
+from em.entity.specs import (
+    Spec,
+    SpecType,
+    MockEntitySpec,
+    ScenarioSpec
+)
+
+from environs import Env
+from loguru import logger
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+env = Env()
+env.read_env()
+
+def get_specs_version() -> str:
+    # cached specs are dropped whenever the spec models change
+    with open(specs.__file__, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+class SpecLoader:
+    # validated specs are cached by path, reused while the file mtime and size are unchanged,
+    # or while the content hash is unchanged when the file was only touched
+    def __init__(self, cache_path: str = None) -> None:
+        self.cache_path = cache_path if cache_path else env.str('SPEC_CACHE_PATH', default=None)
+        self.version = get_specs_version()
+        self.cache = self.load_cache()
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.changed = False
+
+    def load(self, input_files: Iterable[str]) -> Tuple[Dict[str, ScenarioSpec], Dict[str, MockEntitySpec]]:
+        scenario_specs: Dict[str, ScenarioSpec] = {}
+        entity_specs: Dict[str, MockEntitySpec] = {}
+        parsed = 0
+        for input_file in sorted(input_files):
+            # skip non yaml files
+            if not input_file.lower().endswith(('yaml', 'yml')):
+                continue
+            # check if file
+            if not os.path.isfile(input_file):
+                logger.error(f'Input must be a file, path={input_file}')
+                continue
+
+            cached_file = self.load_file(input_file)
+            parsed += cached_file['parsed']
+            spec: Spec = cached_file['spec']
+            if spec.kind == SpecType.SCENARIO:
+                scenario_specs[spec.spec.name] = spec.spec
+            elif spec.kind == SpecType.ENTITY:
+                entity_specs[spec.spec.name] = spec.spec
+
+        # files no longer in the input are dropped from the cache
+        self.changed = self.changed or self.files.keys() != self.cache['files'].keys()
+        logger.debug(f'Parsed input files, parsed={parsed}, cached={len(self.files) - parsed}')
+        return scenario_specs, entity_specs
+
+    def load_file(self, input_file: str) -> Dict[str, Any]:
+        stat = os.stat(input_file)
+        cached_file = self.cache['files'].get(input_file)
+        if cached_file and cached_file['mtime'] == stat.st_mtime_ns and cached_file['size'] == stat.st_size:
+            self.files[input_file] = { **cached_file, 'parsed': False }
+            return self.files[input_file]
+
+        with open(input_file, 'rb') as f:
+            content = f.read()
+        content_hash = hashlib.sha256(content).hexdigest()
+        parsed = not cached_file or cached_file['hash'] != content_hash
+        # load yaml and convert it to pydantic
+        spec = Spec(**yaml.load(content, Loader=SafeLoader)) if parsed else cached_file['spec']
+        self.files[input_file] = { 'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'hash': content_hash, 'spec': spec, 'parsed': parsed }
+        self.changed = True
+        return self.files[input_file]
+
+    def get_entity_order(self, entity_deps: Dict[str, Set[str]]) -> List[str]:
+        # the order only depends on the content of the input files
+        digest = hashlib.sha256()
+        for input_file, cached_file in sorted(self.files.items()):
+            digest.update(f'{input_file}:{cached_file["hash"]}\n'.encode())
+        key = digest.hexdigest()
+
+        cached_key, entity_order = self.cache['order']
+        if cached_key != key:
+            entity_order = list(graphlib.TopologicalSorter(entity_deps).static_order())
+            self.cache['order'] = (key, entity_order)
+            self.changed = True
+        return entity_order
+
+    def load_cache(self) -> Dict[str, Any]:
+        empty_cache = { 'version': self.version, 'files': {}, 'order': (None, None) }
+        if not self.cache_path or not os.path.isfile(self.cache_path):
+            return empty_cache
+        try:
+            with open(self.cache_path, 'rb') as f:
+                cache = pickle.load(f)
+        except Exception as e:
+            logger.warning(f'Spec cache can not be read, path={self.cache_path}, error={e}')
+            return empty_cache
+        return cache if cache.get('version') == self.version else empty_cache
+
+    def save(self) -> None:
+        if not self.cache_path or not self.changed:
+            return
+        files = { input_file: { key: value for key, value in cached_file.items() if key != 'parsed' } for input_file, cached_file in self.files.items() }
+        cache = { 'version': self.version, 'files': files, 'order': self.cache['order'] }
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+            with open(f'{self.cache_path}.tmp', 'wb') as f:
+                pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f'{self.cache_path}.tmp', self.cache_path)
+        except OSError as e:
+            logger.warning(f'Spec cache can not be saved, path={self.cache_path}, error={e}')
@@ -1,133 +1,537 @@
-from abc import ABC, abstractmethod
+from abc import ABC
 from em.entity.entities import (
     MockEntity
 )
 from em.entity.specs import (
     ScenarioEntitySpec,
     MockEntityFieldSpec,
-    TimePrecisionType
+    TimePrecisionType,
+    TransactionType,
+    WriteModeType
 )
 from em.entity.seeders import (
     FieldSeeder,
+    IndexedSeeds,
+    to_seed_array
 )
-from typing import Any, Dict, List
+from em.entity.stores import key_store
+from typing import Any, Callable, Dict, List, Iterable, Iterator, Sequence, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from em.utils.import_utils import load_function
+from em.utils.iter_utils import prefetch
+from em.utils.random_utils import RandomStreams
 from em.entity.specs import MockEntitySpec
-from datetime import datetime, timedelta
-import random
-from decimal import Decimal, ROUND_HALF_UP
-import math
+from datetime import datetime, timedelta, tzinfo
+from decimal import Decimal
+import asyncio
+import numpy
+import time
 
 from loguru import logger
 
 @dataclass
 class MockContext:
+    # reused across records, functions must not keep a reference to it
+    __slots__ = ('index', 'updating', 'field_mocker', 'record_rng', 'record_key')
     index: int
     updating: Dict[str, Any]
+    field_mocker: 'FieldMocker'
+
+    def __post_init__(self) -> None:
+        self.record_rng = None
+        self.record_key = None
+
+    @property
+    def rng(self) -> numpy.random.Generator:
+        # random stream of the field for this record, valid during the call,
+        # reset once per record so the draws of a record follow each other
+        record_key = (self.field_mocker, self.index)
+        if self.record_key != record_key:
+            self.record_rng = self.field_mocker.get_record_rng(self.index)
+            self.record_key = record_key
+        return self.record_rng
+
+@dataclass
+class BatchMockContext:
+    __slots__ = ('index', 'size', 'columns', 'field_mocker')
+    # index of the first record
+    index: int
+    size: int
+    columns: Dict[str, Sequence[Any]]
+    field_mocker: 'FieldMocker'
+
+    def draw(self, function: Callable[[numpy.random.Generator, int], numpy.ndarray], stream: int = 0) -> numpy.ndarray:
+        # function(rng, size) returns size values, a value per record whatever the batch size,
+        # each draw of a batch needs a stream of its own
+        return self.field_mocker.draw(self.index, self.size, function, stream)
 
 class FieldMocker(ABC):
+    # row-wise mockers are evaluated record by record after all columns are mocked
+    rowwise = False
+    # seeded values are drawn by blocks of records, so they only depend on the record index
+    block_size = 4096
+    record_stream = 255
+
     def __init__(self, spec: MockEntityFieldSpec, seeder: type[FieldSeeder] = None):
         self.spec = spec
         self.seeder = seeder
-    
-    def load_seeds(self) -> List[Any]:
-        self.seeds = self.spec.seeds
-        if self.seeder:
-            self.seeds = self.seeds + self.seeder.get_seeds()
+        self.rng = numpy.random.default_rng()
+        self.streams: RandomStreams = None
+        # last block drawn per stream
+        self.blocks: Dict[int, Tuple[int, numpy.ndarray]] = {}
+        self.prepared = False
+
+    def prepare(self) -> None:
+        # resolve seeds and mocker parameters once, mock calls only draw values
+        if self.prepared and not (self.seeder and self.seeder.is_stale()):
+            return
+        seeder_seeds = self.seeder.get_seeds() if self.seeder else []
+        if self.streams is not None and isinstance(seeder_seeds, numpy.ndarray):
+            # seeds read from tables come in no particular order
+            try:
+                seeder_seeds = numpy.sort(seeder_seeds)
+            except TypeError:
+                pass
+        if self.spec.seeds and isinstance(seeder_seeds, IndexedSeeds):
+            raise Exception(f'Seeds can not be combined with seeds read by index, field={self.spec.name}')
+        if self.spec.seeds and len(seeder_seeds):
+            seeder_seeds = seeder_seeds.tolist() if isinstance(seeder_seeds, numpy.ndarray) else list(seeder_seeds)
+            self.seed_array = to_seed_array(self.spec.seeds + seeder_seeds)
+        else:
+            self.seed_array = to_seed_array(seeder_seeds if len(seeder_seeds) else self.spec.seeds)
+        self.blocks = {}
+        self.compile()
+        self.prepared = True
+
+    def reset(self) -> None:
+        self.prepared = False
+
+    def seed(self, streams: RandomStreams) -> None:
+        self.streams = streams
+        self.blocks = {}
+        self.prepared = False
+
+    def draw(self, start: int, size: int, function: Callable[[numpy.random.Generator, int], numpy.ndarray], stream: int = 0) -> numpy.ndarray:
+        # values of records start to start + size, function(rng, size) must return size values, read only
+        if self.streams is None:
+            return function(self.rng, size)
+        parts = []
+        for block in range(start // self.block_size, -(-(start + size) // self.block_size)):
+            drawn_block, values = self.blocks.get(stream, (None, None))
+            if drawn_block != block:
+                values = function(self.streams.get(stream, block), self.block_size)
+                self.blocks[stream] = (block, values)
+            block_start = block * self.block_size
+            parts.append(values[max(start - block_start, 0):start + size - block_start])
+        if len(parts) == 1:
+            return parts[0]
+        return numpy.concatenate(parts) if parts else function(self.rng, 0)
+
+    def get_record_rng(self, index: int) -> numpy.random.Generator:
+        return self.streams.get(self.record_stream, index) if self.streams is not None else self.rng
+
+    def compile(self) -> None:
+        pass
+
+    def require_seeds(self) -> None:
+        if not len(self.seed_array):
+            raise Exception(f'Seeds must be provided, field={self.spec.name}')
 
     def get_name(self):
         return self.spec.name
     
-    @abstractmethod
     def mock(self, context: MockContext, entity: type[MockEntity]) -> Any:
-        pass
+        # a batch of one record, mockers override mock_batch, mock or both
+        value = self.mock_batch(1, context, entity)[0]
+        return value.item() if isinstance(value, numpy.generic) else value
+
+    def mock_batch(self, size: int, context: MockContext, entity: type[MockEntity]) -> Sequence[Any]:
+        # context.index is the index of the first record, context.updating holds the columns mocked so far
+        row_context = MockContext(index=context.index, updating={}, field_mocker=self)
+        values = []
+        for i in range(context.index, context.index + size):
+            row_context.index = i
+            values.append(self.mock(row_context, entity))
+        return values
 
     def __repr__(self) -> str:
         return self.spec.name
     
 class EntityMocker:
-    def __init__(self, entity_spec: MockEntitySpec, entity: type[MockEntity], field_mockers: List[type[FieldMocker]]):
+    def __init__(self, entity_spec: MockEntitySpec, entity: type[MockEntity], field_mockers: List[type[FieldMocker]], key_mocker: 'KeyFieldMocker' = None):
         self.entity_spec = entity_spec
         self.entity = entity
         self.field_mockers  = field_mockers
+        self.field_names = { field_mocker.get_name() for field_mocker in field_mockers }
+        # draws the keys of existing rows in the update and upsert write modes
+        self.key_mocker = key_mocker
+        self.rowwise_field_mockers = [ field_mocker for field_mocker in field_mockers if field_mocker.rowwise ]
+        self.seeded: int = None
+
+        # columns are mocked before any row-wise field
+        rowwise_field_names = { field_mocker.get_name() for field_mocker in self.rowwise_field_mockers }
+        for field_mocker in field_mockers:
+            rowwise_dependencies = rowwise_field_names.intersection(field_mocker.spec.dependencies)
+            if not field_mocker.rowwise and rowwise_dependencies:
+                raise Exception(f'Batch fields can not depend on row-wise fields, field={field_mocker.get_name()}, dependencies={sorted(rowwise_dependencies)}')
+
+        publish_spec = entity_spec.publish
+        if publish_spec:
+            unknown_fields = set(publish_spec.fields) - self.field_names
+            if unknown_fields:
+                raise Exception(f'Published fields must be mocked fields, entity={entity_spec.name}, fields={sorted(unknown_fields)}')
+            if publish_spec.returning and not entity.supports_returning:
+                raise Exception(f'Returning columns are not supported by the entity implementation, entity={entity_spec.name}, implementation={entity_spec.implementation}')
+
+        update_spec = entity_spec.update
+        if update_spec:
+            unknown_fields = set(update_spec.fields) - self.field_names
+            if unknown_fields:
+                raise Exception(f'Updated fields must be mocked fields, entity={entity_spec.name}, fields={sorted(unknown_fields)}')
+            # the key only identifies rows, an update without other fields would have nothing to set
+            updated_fields = set(update_spec.fields if update_spec.fields else self.field_names) - { update_spec.key }
+            if not updated_fields:
+                raise Exception(f'Updated fields must include a field other than the key, entity={entity_spec.name}, key={update_spec.key}')
     
     def load_entity_records(self):
         self.entity.load_records()
 
-    def mock(self, scenario_entity_spec: ScenarioEntitySpec):
+    def validate(self, scenario_entity_spec: ScenarioEntitySpec = None):
+        write_mode = scenario_entity_spec.writeMode if scenario_entity_spec else WriteModeType.INSERT
+        if write_mode != WriteModeType.INSERT:
+            if not self.entity.supports_updates:
+                raise Exception(f'Updates are not supported by the entity implementation, entity={self.entity_spec.name}, implementation={self.entity_spec.implementation}, write_mode={write_mode.value}')
+            if not self.key_mocker:
+                raise Exception(f'An update spec must be provided, entity={self.entity_spec.name}, write_mode={write_mode.value}')
+            if write_mode == WriteModeType.UPSERT and self.key_mocker.get_name() not in self.field_names:
+                raise Exception(f'Upserted records must mock the key of new rows, entity={self.entity_spec.name}, key={self.key_mocker.get_name()}')
+            if self.entity_spec.publish and self.entity_spec.publish.returning:
+                raise Exception(f'Returning columns can only be published by inserts, entity={self.entity_spec.name}, write_mode={write_mode.value}')
+        self.entity.validate(write_mode)
+
+    def finish(self):
+        self.entity.finish()
+
+    def prepare(self):
+        for field_mocker in self.field_mockers:
+            field_mocker.prepare()
+
+    def seed(self, seed: int):
+        # a stream per field, records of any batch, shard or worker draw the same values
+        if seed == self.seeded:
+            return
+        for field_mocker in self.field_mockers:
+            field_mocker.seed(RandomStreams(seed, self.entity_spec.name, field_mocker.get_name()))
+        if self.key_mocker:
+            self.key_mocker.seed(RandomStreams(seed, self.entity_spec.name, 'update', self.key_mocker.get_name()))
+        self.seeded = seed
+
+    def mock(self, scenario_entity_spec: ScenarioEntitySpec, seed: int = None):
         logger.debug(f'Mock {self.entity_spec.name} entity')
-        records = []
-        for i in range(scenario_entity_spec.records):
-            updating = {}
-            for field_mocker in self.field_mockers:
-                field_mocker.load_seeds()
-                mock_data = field_mocker.mock(MockContext(index=i, updating=updating), self.entity)
-                updating[field_mocker.get_name()] = mock_data
-            records.append(updating.copy())
-        self.entity.insertall(records)
+        if seed is not None:
+            self.seed(seed)
+        # prepare on the calling thread, so seeds are read within its transaction
+        self.prepare()
+        batches = self.generate(scenario_entity_spec, seed)
+        if scenario_entity_spec.connections == 1:
+            batches = self.prefetch(scenario_entity_spec, batches)
+        self.insertall(scenario_entity_spec, batches)
+        self.finish()
+
+    def prefetch(self, scenario_entity_spec: ScenarioEntitySpec, batches: Iterable[List[Dict[str, Any]]]) -> Iterator[List[Dict[str, Any]]]:
+        # keys of existing rows are read while generating, updates are generated by the writing thread
+        # so keys are read within its run or shared transaction
+        if scenario_entity_spec.writeMode != WriteModeType.INSERT:
+            return iter(batches)
+        return prefetch(batches, scenario_entity_spec.prefetch)
+
+    def insertall(self, scenario_entity_spec: ScenarioEntitySpec, batches: Iterable[List[Dict[str, Any]]]):
+        if scenario_entity_spec.connections > 1:
+            if scenario_entity_spec.transaction == TransactionType.RUN:
+                raise Exception(f'A run transaction can not be written through more than one connection, entity={self.entity_spec.name}, connections={scenario_entity_spec.connections}')
+            asyncio.run(self.insertall_concurrently(scenario_entity_spec, batches))
+        elif scenario_entity_spec.transaction == TransactionType.RUN:
+            with self.entity.transaction():
+                for records in batches:
+                    self.publish(records, self.write(scenario_entity_spec, records))
+        else:
+            for records in batches:
+                with self.entity.transaction():
+                    returned = self.write(scenario_entity_spec, records)
+                self.publish(records, returned)
+
+    def write(self, scenario_entity_spec: ScenarioEntitySpec, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if scenario_entity_spec.writeMode == WriteModeType.INSERT:
+            # sinks overriding insertall(records) before load modes existed are only passed records
+            return self.entity.insertall(records, load_mode=scenario_entity_spec.loadMode) if scenario_entity_spec.loadMode else self.entity.insertall(records)
+        self.entity.updateall(records, scenario_entity_spec.writeMode, scenario_entity_spec.loadMode)
+        return None
+
+    async def write_async(self, session: Any, scenario_entity_spec: ScenarioEntitySpec, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if scenario_entity_spec.writeMode == WriteModeType.INSERT:
+            return await self.entity.insertall_async(session, records, scenario_entity_spec.loadMode)
+        await self.entity.updateall_async(session, records, scenario_entity_spec.writeMode, scenario_entity_spec.loadMode)
+        return None
+
+    def publish(self, records: List[Dict[str, Any]], returned: List[Dict[str, Any]]):
+        # written values of the published fields are read by the entities seeded from this one
+        publish_spec = self.entity_spec.publish
+        if not publish_spec:
+            return
+        for field in publish_spec.fields:
+            key_store.publish(self.entity_spec.name, field, [ record[field] for record in records ], publish_spec.capacity)
+        for column in publish_spec.returning if returned else []:
+            key_store.publish(self.entity_spec.name, column, [ row[column] for row in returned ], publish_spec.capacity)
+
+    async def insertall_concurrently(self, scenario_entity_spec: ScenarioEntitySpec, batches: Iterable[List[Dict[str, Any]]]):
+        # batches are generated by one thread into a bounded queue and written by one task per connection,
+        # generation waits while prefetch batches are queued
+        queue = asyncio.Queue(maxsize=max(scenario_entity_spec.prefetch, 1))
+        loop = asyncio.get_running_loop()
+
+        async def produce(generator: ThreadPoolExecutor) -> None:
+            iterator = iter(batches)
+            while True:
+                records = await loop.run_in_executor(generator, next, iterator, None)
+                if records is None:
+                    break
+                await queue.put(records)
+            for _ in range(scenario_entity_spec.connections):
+                await queue.put(None)
+
+        async def consume() -> None:
+            async with self.entity.async_session() as session:
+                while True:
+                    records = await queue.get()
+                    if records is None:
+                        return
+                    returned = await self.write_async(session, scenario_entity_spec, records)
+                    self.publish(records, returned)
+
+        with ThreadPoolExecutor(1, thread_name_prefix='em-generator') as generator:
+            tasks = [ asyncio.ensure_future(produce(generator)) ] + [ asyncio.ensure_future(consume()) for _ in range(scenario_entity_spec.connections) ]
+            finished, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            # a failed writer stops the others
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for task in finished:
+                task.result()
+
+    def split_shards(self, scenario_entity_spec: ScenarioEntitySpec) -> List[Tuple[int, int]]:
+        # shard boundaries only depend on the spec, never on the number of workers
+        shard_size = scenario_entity_spec.shardSize if scenario_entity_spec.shardSize else scenario_entity_spec.records
+        return [ (start, min(start + shard_size, scenario_entity_spec.records)) for start in range(0, scenario_entity_spec.records, shard_size) ]
+
+    def generate(self, scenario_entity_spec: ScenarioEntitySpec, seed: int = None) -> Iterator[List[Dict[str, Any]]]:
+        if seed is not None:
+            self.seed(seed)
+        self.prepare()
+        for shard_index, (start, stop) in enumerate(self.split_shards(scenario_entity_spec)):
+            yield from self.generate_shard(scenario_entity_spec, shard_index, start, stop, seed)
+
+    def generate_shard(self, scenario_entity_spec: ScenarioEntitySpec, shard_index: int, start: int, stop: int, seed: int = None) -> Iterator[List[Dict[str, Any]]]:
+        if seed is not None:
+            self.seed(seed)
+        for batch_start in range(start, stop, scenario_entity_spec.batchSize):
+            batch_stop = min(batch_start + scenario_entity_spec.batchSize, stop)
+            # picks up refreshed seeds, a no-op for prepared mockers otherwise
+            self.prepare()
+            logger.debug(f'Mock {self.entity_spec.name} batch, shard={shard_index}, start={batch_start}, stop={batch_stop}')
+            yield self.mock_records(batch_start, batch_stop, scenario_entity_spec.writeMode, scenario_entity_spec.updateRatio)
+
+    def mock_records(self, start: int, stop: int, write_mode: WriteModeType = WriteModeType.INSERT, update_ratio: float = 1.0) -> List[Dict[str, Any]]:
+        size = stop - start
+        key, keys, updated = self.mock_keys(start, size, write_mode, update_ratio) if write_mode != WriteModeType.INSERT else (None, None, None)
+        # mock whole columns first, only row-wise fields (custom functions) need a pass per record
+        columns = {}
+        if keys is not None and key not in self.field_names:
+            # updated rows are identified by the key even when it is not a mocked field
+            columns[key] = keys
+        for field_mocker in self.field_mockers:
+            if field_mocker.rowwise:
+                columns[field_mocker.get_name()] = [ None ] * size
+            else:
+                columns[field_mocker.get_name()] = field_mocker.mock_batch(size, MockContext(index=start, updating=columns, field_mocker=field_mocker), self.entity)
+            if keys is not None and key == field_mocker.get_name():
+                # upserted records not drawn for an update keep the mocked key of a new row
+                columns[key] = keys if updated is None else numpy.where(updated, keys, numpy.asarray(columns[key], dtype=object))
+
+        names = list(columns.keys())
+        values = [ column.tolist() if isinstance(column, numpy.ndarray) else column for column in columns.values() ]
+        records = [ dict(zip(names, record_values)) for record_values in zip(*values) ]
+
+        if self.rowwise_field_mockers:
+            context = MockContext(index=start, updating=None, field_mocker=None)
+            for i, updating in enumerate(records, start):
+                context.index = i
+                context.updating = updating
+                for field_mocker in self.rowwise_field_mockers:
+                    context.field_mocker = field_mocker
+                    updating[field_mocker.get_name()] = field_mocker.mock(context, self.entity)
+        return records
+
+    def mock_keys(self, start: int, size: int, write_mode: WriteModeType, update_ratio: float) -> Tuple[str, Sequence[Any], numpy.ndarray]:
+        # keys of existing rows drawn for the records, and the upserted records they are drawn for
+        # when only a share of them updates rows
+        self.key_mocker.prepare()
+        key = self.key_mocker.get_name()
+        if not len(self.key_mocker.seed_array):
+            if write_mode == WriteModeType.UPSERT:
+                # nothing to update yet, every record is inserted
+                return key, None, None
+            raise Exception(f'Rows must exist to be updated, entity={self.entity_spec.name}, key={key}')
+        keys = self.key_mocker.mock_batch(size, MockContext(index=start, updating=None, field_mocker=self.key_mocker), self.entity)
+        if write_mode == WriteModeType.UPDATE or update_ratio >= 1:
+            return key, keys, None
+        updated = self.key_mocker.draw(start, size, lambda rng, n: rng.random(n), stream=1) < update_ratio
+        return key, keys.astype(object), updated
 
 class CustomFieldMocker(FieldMocker):
     def __init__(self, spec: MockEntityFieldSpec, seeder: FieldSeeder = None):
         super().__init__(spec, seeder)
         self.custom_function = load_function(self.spec.function)
+        self.rowwise = not self.spec.batch
 
     def mock(self, context: MockContext, entity: type[MockEntity]) -> Any:
+        if self.spec.batch:
+            return self.mock_batch(1, context, entity)[0]
         return self.custom_function(context, entity)
 
+    def mock_batch(self, size: int, context: MockContext, entity: type[MockEntity]) -> Sequence[Any]:
+        if not self.spec.batch:
+            return super().mock_batch(size, context, entity)
+        columns = { dependency: context.updating[dependency] for dependency in self.spec.dependencies }
+        column = self.custom_function(BatchMockContext(index=context.index, size=size, columns=columns, field_mocker=self), entity)
+        if len(column) != size:
+            raise Exception(f'Custom function must return a value per record, field={self.spec.name}, size={size}, returned={len(column)}')
+        return column
+
 class RandomIntFieldMocker(FieldMocker):
-    def mock(self, context: MockContext, entity: type[MockEntity]) -> Any:
-        number = random.randint(self.spec.min, self.spec.max)
-        rounding_base = self.spec.precision if self.spec.precision else 1
-        return math.ceil(number / rounding_base) * rounding_base
+    def compile(self) -> None:
+        self.low = int(self.spec.min)
+        self.high = int(self.spec.max)
+        self.rounding_base = int(self.spec.precision) if self.spec.precision else 1
+
+    def mock_batch(self, size: int, context: MockContext, entity: type[MockEntity]) -> Sequence[Any]:
+        numbers = self.draw(context.index, size, lambda rng, n: rng.integers(self.low, self.high, n, endpoint=True))
+        return -(-numbers // self.rounding_base) * self.rounding_base
 
 class RandomDecimalFieldMocker(FieldMocker):
-    def mock(self, context: MockContext, entity: type[MockEntity]) -> Any:
-        number = (self.spec.max - self.spec.min) * random.random() + self.spec.min
-        decimal_places = self.spec.precision if self.spec.precision else 3
-        return Decimal(number).quantize(Decimal(10) ** (-1 * decimal_places), ROUND_HALF_UP)
+    def compile(self) -> None:
+        self.low = float(self.spec.min)
+        self.span = float(self.spec.max) - self.low
+        self.decimal_places = int(self.spec.precision) if self.spec.precision else 3
+        self.scale = 10 ** self.decimal_places
+
+    def mock_batch(self, size: int, context: MockContext, entity: type[MockEntity]) -> Sequence[Any]:
+        numbers = self.span * self.draw(context.index, size, lambda rng, n: rng.random(n)) + self.low
+        # round half up (away from zero) on the scaled integers, then shift the decimal point back
+        scaled = numpy.sign(numbers) * numpy.floor(numpy.abs(numbers) * self.scale + 0.5)
+        return [ Decimal(number).scaleb(-self.decimal_places) for number in scaled.astype(numpy.int64).tolist() ]
 
 class RandomFieldMocker(FieldMocker):
-    def mock(self, context: MockContext, entity: MockEntity) -> Any:
-        if not self.seeds:
-            raise Exception(f'Seeds must be provided, field={self.spec.name}')
-        return random.choice(self.seeds)
+    def compile(self) -> None:
+        self.require_seeds()
+
+    def mock_batch(self, size: int, context: MockContext, entity: type[MockEntity]) -> Sequence[Any]:
+        return self.seed_array[self.draw(context.index, size, lambda rng, n: rng.integers(0, len(self.seed_array), n))]
+
+class KeyFieldMocker(RandomFieldMocker):
+    # keys read from the table of the entity, none before its first rows are written
+    def compile(self) -> None:
+        pass
 
 class ConstantFieldMocker(FieldMocker):
-    def mock(self, context: MockContext, entity: type[MockEntity]) -> Any:
-        if self.spec.nullable and random.random() < 0.4:
-            return None
-        if not self.seeds:
-            raise Exception(f'Seeds must be provided, field={self.spec.name}')
-        return self.seeds[context.index % len(self.seeds)]
+    def compile(self) -> None:
+        self.require_seeds()
+        self.null_probability = 0.4 if self.spec.nullable else 0
+
+    def mock_batch(self, size: int, context: MockContext, entity: type[MockEntity]) -> Sequence[Any]:
+        values = self.seed_array[numpy.arange(context.index, context.index + size) % len(self.seed_array)]
+        if self.null_probability:
+            values = values.astype(object, copy=False)
+            values[self.draw(context.index, size, lambda rng, n: rng.random(n)) < self.null_probability] = None
+        return values
     
 class RandomDateTimeFieldMocker(FieldMocker):
+    # seconds before a default window (the last 24 hours) is moved to the clock, in daemon mode
+    window_refresh = 1.0
+
     def __init__(self, spec: MockEntityFieldSpec, seeder: FieldSeeder = None):
         super().__init__(spec, seeder)
+        self.interval_us = parse_interval_us(self.spec.interval)
+        self.window_at: float = None
+
+    def prepare(self) -> None:
+        # called before each batch, the window is otherwise fixed once prepared
+        if self.prepared and not (self.spec.min and self.spec.max) and time.monotonic() - self.window_at >= self.window_refresh:
+            self.prepared = False
+        super().prepare()
+
+    def compile(self) -> None:
         now = datetime.now()
         self.min_dt = datetime.strptime(self.spec.min, self.spec.format) if self.spec.min else now - timedelta(hours=24)
         self.max_dt = datetime.strptime(self.spec.max, self.spec.format) if self.spec.max else now
-        self.interval_td = self.parse_interval_dt(self.spec.interval)
-    
-    def mock(self, context: MockContext, entity: type[MockEntity]) -> Any:
-        timeslots = (self.max_dt - self.min_dt) // self.interval_td
-        return self.min_dt + self.interval_td * random.randint(0, timeslots)
+        self.window_at = time.monotonic()
+        self.timeslots = (self.max_dt - self.min_dt) // timedelta(microseconds=self.interval_us)
+        # wall clock of the min timezone, as integer microseconds
+        self.min_us = to_epoch_us(self.min_dt)
 
-    def parse_interval_dt(self, value: str) -> int:
-        count = int(value[:-1])
-        unit = value[-1]
-        allowed_units = {'s': 'seconds', 'm': 'minutes', 'h': 'hours'}
-        return timedelta(**{allowed_units[unit]: count}) if unit in allowed_units else None
+    def mock_batch(self, size: int, context: MockContext, entity: type[MockEntity]) -> Sequence[Any]:
+        offsets = self.draw(context.index, size, lambda rng, n: rng.integers(0, self.timeslots, n, endpoint=True)) * self.interval_us
+        return to_datetimes(self.min_us + offsets, self.min_dt.tzinfo)
 
 class CurrentDateTimeFieldMocker(FieldMocker):
-    def mock(self, context: MockContext, entity: type[MockEntity]) -> Any:
-        dt = datetime.now()
-        if isinstance(self.spec.precision, TimePrecisionType):
-            if self.spec.precision == TimePrecisionType.HOUR:
-                dt = dt.replace(minute=0, second=0, microsecond=0)
-            elif self.spec.precision == TimePrecisionType.MINUTE:
-                dt = dt.replace(second=0, microsecond=0)
-            elif self.spec.precision == TimePrecisionType.SECOND:
-                dt = dt.replace(microsecond=0)
-        return dt
-        
\ No newline at end of file
+    def __init__(self, spec: MockEntityFieldSpec, seeder: FieldSeeder = None):
+        super().__init__(spec, seeder)
+        self.last_us: int = None
+
+    def compile(self) -> None:
+        self.truncation_us = truncation_units_us[self.spec.precision] if isinstance(self.spec.precision, TimePrecisionType) else 1
+        self.increment_us = parse_interval_us(self.spec.increment) if self.spec.increment else 0
+
+    def mock_batch(self, size: int, context: MockContext, entity: type[MockEntity]) -> Sequence[Any]:
+        # the clock is read once per batch
+        clock_us = to_epoch_us(datetime.now())
+        if self.increment_us:
+            # records keep increasing across batches, even when generated faster than the increment
+            if self.last_us is not None:
+                clock_us = max(clock_us, self.last_us + self.increment_us)
+            values = clock_us + numpy.arange(size, dtype=numpy.int64) * self.increment_us
+            if size:
+                self.last_us = int(values[-1])
+        else:
+            values = numpy.full(size, clock_us, dtype=numpy.int64)
+        if self.truncation_us > 1:
+            values -= values % self.truncation_us
+        return to_datetimes(values)
+
+EPOCH = datetime(1970, 1, 1)
+
+interval_units_us = { 'us': 1, 'ms': 1000, 's': 1000000, 'm': 60000000, 'h': 3600000000 }
+
+truncation_units_us = {
+    TimePrecisionType.HOUR: 3600000000,
+    TimePrecisionType.MINUTE: 60000000,
+    TimePrecisionType.SECOND: 1000000
+}
+
+def parse_interval_us(value: str) -> int:
+    unit = value.lstrip('0123456789')
+    count = value[:len(value) - len(unit)]
+    if not count or unit not in interval_units_us:
+        raise Exception(f'Interval must be a number followed by one of {list(interval_units_us.keys())}, interval={value}')
+    return int(count) * interval_units_us[unit]
+
+def to_epoch_us(dt: datetime) -> int:
+    # wall clock, the timezone of aware datetimes is ignored
+    return (dt.replace(tzinfo=None) - EPOCH) // timedelta(microseconds=1)
+
+def to_datetimes(values_us: numpy.ndarray, tzinfo: tzinfo = None) -> Sequence[Any]:
+    # naive datetimes stay datetime64 until the records are built, aware ones are built here
+    values = values_us.astype(numpy.int64, copy=False).view('datetime64[us]')
+    if tzinfo is None:
+        return values
+    return [ value.replace(tzinfo=tzinfo) for value in values.tolist() ]
@@ -0,0 +1,151 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Sequence, Tuple, Union
+import threading
+import random
+import shutil
+import math
+import sys
+
+from em.entity.specs import (
+    PreviewModeType,
+    PreviewSpec
+)
+
+from prettytable import PrettyTable
+
+class RecordValues(Sequence[Tuple[Any]]):
+    # values of records, only converted when a preview reads them
+    def __init__(self, records: Sequence[Dict[str, Any]]) -> None:
+        self.records = records
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return [ tuple(record.values()) for record in self.records[index] ]
+        return tuple(self.records[index].values())
+
+class TablePreview(ABC):
+    # holds at most rows records of the batches written, printed by finish
+    def __init__(self, title: str, rows: int) -> None:
+        self.title = title
+        self.size = rows
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.columns: Sequence[str] = None
+        self.rows: List[Tuple[Any]] = []
+        self.seen = 0
+
+    def add(self, columns: Sequence[str], rows: Sequence[Tuple[Any]]) -> None:
+        with self.lock:
+            if self.columns is None:
+                self.columns = columns
+            self.add_rows(rows)
+            self.seen += len(rows)
+
+    @abstractmethod
+    def add_rows(self, rows: Sequence[Tuple[Any]]) -> None:
+        raise NotImplementedError()
+
+    def finish(self) -> None:
+        with self.lock:
+            if self.rows:
+                self.print()
+            self.reset()
+
+    def print(self) -> None:
+        print_table(f'{self.title}, records={self.seen}', self.columns, self.rows)
+
+class FirstRowsPreview(TablePreview):
+    def add_rows(self, rows: Sequence[Tuple[Any]]) -> None:
+        if len(self.rows) < self.size:
+            self.rows.extend(rows[:self.size - len(self.rows)])
+
+class SampledRowsPreview(TablePreview):
+    # reservoir sample with geometric skips (algorithm L), only sampled rows of a batch are read
+    def __init__(self, title: str, rows: int) -> None:
+        self.rng = random.Random()
+        super().__init__(title, rows)
+
+    def reset(self) -> None:
+        super().reset()
+        self.weight = math.exp(math.log(self.random()) / self.size)
+        self.next_index = self.size + self.skip()
+
+    def random(self) -> float:
+        # in (0, 1), log(0) is undefined
+        return max(self.rng.random(), sys.float_info.min)
+
+    def skip(self) -> int:
+        return math.floor(math.log(self.random()) / math.log(1 - self.weight))
+
+    def add_rows(self, rows: Sequence[Tuple[Any]]) -> None:
+        if len(self.rows) < self.size:
+            self.rows.extend(rows[:self.size - len(self.rows)])
+        stop = self.seen + len(rows)
+        while self.next_index < stop:
+            self.rows[self.rng.randrange(self.size)] = rows[self.next_index - self.seen]
+            self.weight *= math.exp(math.log(self.random()) / self.size)
+            self.next_index += self.skip() + 1
+
+class SummaryPreview(SampledRowsPreview):
+    # exact record count, statistics over the sampled rows
+    def print(self) -> None:
+        rows = []
+        for column, values in zip(self.columns, zip(*self.rows)):
+            present = [ value for value in values if value is not None ]
+            try:
+                low, high = (min(present), max(present)) if present else (None, None)
+            except TypeError:
+                low, high = None, None
+            distinct = len(set(map(repr, present)))
+            rows.append((column, type(present[0]).__name__ if present else None, len(values) - len(present), distinct, low, high))
+        print_table(f'{self.title}, records={self.seen}, sampled={len(self.rows)}', [ 'field', 'type', 'nulls', 'distinct', 'min', 'max' ], rows)
+
+preview_klasses: Dict[PreviewModeType, type[TablePreview]] = {
+    PreviewModeType.FIRST: FirstRowsPreview,
+    PreviewModeType.SAMPLE: SampledRowsPreview,
+    PreviewModeType.SUMMARY: SummaryPreview
+}
+
+def build_preview(spec: PreviewSpec, title: str) -> TablePreview:
+    if spec.mode == PreviewModeType.OFF:
+        return None
+    return preview_klasses[spec.mode](title, spec.rows)
+
+def print_table(title: str, columns: Sequence[str], rows: List[Tuple[Any]]):
+    screen_width = shutil.get_terminal_size().columns
+
+    cells = [ columns ] + [ list(map(str, row)) for row in rows ]
+    max_column_widths = [ max(len(cell) + 10 for cell in column_cells) for column_cells in zip(*cells)] 
+
+    current_width = 0
+    current_indices = []
+    subtables = []
+
+    for i, max_column_width in enumerate(max_column_widths):
+        if current_width + max_column_width < screen_width:
+            current_width += max_column_width
+            current_indices.append(i)
+        else:
+            subtables.append(current_indices)
+            current_width = max_column_width
+            current_indices = [i]
+
+    if current_indices:
+        subtables.append(current_indices)
+
+    for indices in subtables:
+        subcolumns = [ columns[i] for i in indices ]
+        subvalues = [ tuple(row[i] for i in indices) for row in rows ]
+
+        table = PrettyTable()
+        table.title = title
+        table.field_names = subcolumns
+        table.align = 'r'
+        table.add_rows(subvalues)
+        print(table)
+        print()
@@ -0,0 +1,221 @@
+import graphlib
+import math
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, FIRST_EXCEPTION, wait
+from multiprocessing.managers import SyncManager
+from typing import Any, Dict, Iterable, Iterator, List, Set
+
+from em.entity.builders import build_entity_mockers
+from em.entity.entities import PostgresConnector, PostgresMockEntity
+from em.entity.mockers import EntityMocker
+from em.entity.stores import key_store
+from em.entity.specs import (
+    MockEntitySpec,
+    ScenarioEntitySpec,
+    TransactionType
+)
+from em.utils.profile_utils import profiler
+from em.utils.rate_utils import TokenBucket
+
+from loguru import logger
+
+# entity mockers of a generator process, built once by init_generator
+generator_entity_mockers: Dict[str, EntityMocker] = {}
+
+def init_generator(entity_specs: Dict[str, MockEntitySpec], entity_deps: Dict[str, Set[str]], profile: bool) -> None:
+    if profile:
+        profiler.enable()
+    for entity_mocker in build_entity_mockers(entity_specs, entity_deps):
+        generator_entity_mockers[entity_mocker.entity_spec.name] = entity_mocker
+
+def mock_shard(entity_name: str, scenario_entity_spec: ScenarioEntitySpec, shard_index: int, start: int, stop: int, seed: int, published: Dict[Any, Any], batches: queue.Queue, stopped: Any) -> Dict[Any, List[float]]:
+    def put(records: List[Dict[str, Any]]) -> None:
+        while not stopped.is_set():
+            try:
+                batches.put(records, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    entity_mocker = generator_entity_mockers[entity_name]
+    # values published by the seed entities, written by the loaders of the main process
+    key_store.load(published)
+    try:
+        if seed is not None:
+            entity_mocker.seed(seed)
+        entity_mocker.prepare()
+        for records in entity_mocker.generate_shard(scenario_entity_spec, shard_index, start, stop, seed):
+            put(records)
+            if stopped.is_set():
+                break
+    finally:
+        put(None)
+    # profile of the shard, merged by the loader
+    return profiler.collect()
+
+class EntityScheduler:
+    def __init__(self, entity_specs: Dict[str, MockEntitySpec], entity_deps: Dict[str, Set[str]], entity_mockers: List[EntityMocker], workers: int, seed: int = None) -> None:
+        self.entity_specs = entity_specs
+        self.entity_deps = entity_deps
+        self.entity_mockers = { entity_mocker.entity_spec.name: entity_mocker for entity_mocker in entity_mockers }
+        self.workers = workers
+        self.seed = seed
+        # set once a shard fails, the other shards stop between batches
+        self.stopped = threading.Event()
+        if any(isinstance(entity_mocker.entity, PostgresMockEntity) for entity_mocker in entity_mockers):
+            PostgresConnector.get_instance().reserve(workers)
+
+    def run(self, scenario_entity_specs: Dict[str, ScenarioEntitySpec]) -> None:
+        # shards are generated by a process pool and written by a thread pool, each with its own connection,
+        # an entity is scheduled once all entities it seeds from are committed
+        entity_top_sorter = graphlib.TopologicalSorter(self.entity_deps)
+        entity_top_sorter.prepare()
+
+        with multiprocessing.Manager() as manager:
+            generators = ProcessPoolExecutor(self.workers, initializer=init_generator, initargs=(self.entity_specs, self.entity_deps, profiler.enabled))
+            loaders = ThreadPoolExecutor(self.workers, thread_name_prefix='em-loader')
+            try:
+                running: Dict[Future, str] = {}
+                remaining_shards: Dict[str, int] = {}
+                while entity_top_sorter.is_active():
+                    for entity_name in entity_top_sorter.get_ready():
+                        scenario_entity_spec = scenario_entity_specs.get(entity_name)
+                        shards = self.entity_mockers[entity_name].split_shards(scenario_entity_spec) if scenario_entity_spec else []
+                        if not shards:
+                            entity_top_sorter.done(entity_name)
+                            continue
+                        logger.debug(f'Schedule {entity_name} entity, shards={len(shards)}')
+                        self.entity_mockers[entity_name].load_entity_records()
+                        remaining_shards[entity_name] = len(shards)
+                        published = key_store.snapshot(self.entity_deps[entity_name])
+                        for shard_index, (start, stop) in enumerate(shards):
+                            future = loaders.submit(self.load_shard, entity_name, scenario_entity_spec, shard_index, start, stop, published, generators, manager)
+                            running[future] = entity_name
+                    if not running:
+                        continue
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        entity_name = running.pop(future)
+                        future.result()
+                        remaining_shards[entity_name] -= 1
+                        if remaining_shards[entity_name] == 0:
+                            logger.debug(f'Committed {entity_name} entity')
+                            self.entity_mockers[entity_name].finish()
+                            entity_top_sorter.done(entity_name)
+            except BaseException:
+                # running shards roll back on their next batch, the error is raised without waiting for them
+                self.stopped.set()
+                generators.shutdown(wait=False, cancel_futures=True)
+                loaders.shutdown(wait=False, cancel_futures=True)
+                raise
+            loaders.shutdown()
+            generators.shutdown()
+
+    def load_shard(self, entity_name: str, scenario_entity_spec: ScenarioEntitySpec, shard_index: int, start: int, stop: int, published: Dict[Any, Any], generators: Executor, manager: SyncManager) -> None:
+        logger.debug(f'Mock {entity_name} shard, shard={shard_index}, start={start}, stop={stop}')
+        batches = manager.Queue(maxsize=scenario_entity_spec.prefetch + 1)
+        stopped = manager.Event()
+        future = generators.submit(mock_shard, entity_name, scenario_entity_spec, shard_index, start, stop, self.seed, published, batches, stopped)
+        try:
+            self.entity_mockers[entity_name].insertall(scenario_entity_spec, self.receive(entity_name, batches, future))
+        finally:
+            stopped.set()
+        profiler.merge(future.result())
+
+    def receive(self, entity_name: str, batches: queue.Queue, future: Future) -> Iterator[List[Dict[str, Any]]]:
+        while True:
+            if self.stopped.is_set():
+                raise Exception(f'Shard stopped after another shard failed, entity={entity_name}')
+            try:
+                records = batches.get(timeout=1)
+            except queue.Empty:
+                # raises if the shard failed or was cancelled before it could finish the stream
+                if future.done():
+                    future.result()
+                continue
+            if records is None:
+                break
+            yield records
+        future.result()
+
+class RateScheduler:
+    # runs the entities of a scenario continuously, each paced at its rate by a token bucket,
+    # entity mockers and pooled connections stay warm between batches
+    pacing_interval = 0.1
+    report_interval = 60
+
+    def __init__(self, entity_mockers: List[EntityMocker], seed: int = None) -> None:
+        self.entity_mockers = { entity_mocker.entity_spec.name: entity_mocker for entity_mocker in entity_mockers }
+        self.seed = seed
+        self.stopped = threading.Event()
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def run(self, scenario_entity_specs: Dict[str, ScenarioEntitySpec]) -> None:
+        # entities without rate are mocked once, in topological order, before any stream starts
+        streamed_entity_specs: List[ScenarioEntitySpec] = []
+        for entity_name, entity_mocker in self.entity_mockers.items():
+            scenario_entity_spec = scenario_entity_specs.get(entity_name)
+            if not scenario_entity_spec:
+                continue
+            if scenario_entity_spec.rate is None:
+                entity_mocker.load_entity_records()
+                entity_mocker.mock(scenario_entity_spec, self.seed)
+            elif scenario_entity_spec.transaction == TransactionType.RUN:
+                raise Exception(f'A streamed entity must commit every batch, entity={entity_name}, transaction={scenario_entity_spec.transaction.value}')
+            else:
+                streamed_entity_specs.append(scenario_entity_spec)
+
+        if not streamed_entity_specs:
+            raise Exception(f'A rate must be set on at least one scenario entity in daemon mode, entities={list(scenario_entity_specs.keys())}')
+
+        with ThreadPoolExecutor(len(streamed_entity_specs), thread_name_prefix='em-stream') as streamers:
+            futures = [ streamers.submit(self.stream, scenario_entity_spec) for scenario_entity_spec in streamed_entity_specs ]
+            try:
+                # a failed stream stops all the others
+                finished, _ = wait(futures, return_when=FIRST_EXCEPTION)
+                for future in finished:
+                    future.result()
+            finally:
+                self.stopped.set()
+
+    def stream(self, scenario_entity_spec: ScenarioEntitySpec) -> None:
+        entity_mocker = self.entity_mockers[scenario_entity_spec.name]
+        # small batches keep the writes evenly spread over each second
+        batch_size = min(scenario_entity_spec.batchSize, max(1, math.ceil(scenario_entity_spec.rate * self.pacing_interval)))
+        bucket = TokenBucket(scenario_entity_spec.rate, capacity=batch_size)
+        logger.info(f'Stream {scenario_entity_spec.name} entity, rate={scenario_entity_spec.rate}, batch_size={batch_size}')
+
+        entity_mocker.load_entity_records()
+        if self.seed is not None:
+            entity_mocker.seed(self.seed)
+        entity_mocker.prepare()
+        batches = entity_mocker.prefetch(scenario_entity_spec, self.generate(entity_mocker, scenario_entity_spec, bucket, batch_size))
+        try:
+            entity_mocker.insertall(scenario_entity_spec, self.report(scenario_entity_spec.name, batches))
+        finally:
+            entity_mocker.finish()
+
+    def generate(self, entity_mocker: EntityMocker, scenario_entity_spec: ScenarioEntitySpec, bucket: TokenBucket, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+        start = 0
+        while bucket.acquire(batch_size, self.stopped):
+            # picks up refreshed seeds
+            entity_mocker.prepare()
+            yield entity_mocker.mock_records(start, start + batch_size, scenario_entity_spec.writeMode, scenario_entity_spec.updateRatio)
+            start += batch_size
+
+    def report(self, entity_name: str, batches: Iterable[List[Dict[str, Any]]]) -> Iterator[List[Dict[str, Any]]]:
+        # a batch is written once the next one is requested
+        written, reported = 0, 0
+        reported_at = time.monotonic()
+        for records in batches:
+            yield records
+            written += len(records)
+            now = time.monotonic()
+            if now - reported_at >= self.report_interval:
+                logger.info(f'Streamed {entity_name} entity, records={written}, rate={(written - reported) / (now - reported_at):.1f}')
+                reported, reported_at = written, now
@@ -1,34 +1,270 @@
+from em.entity.caches import (
+    CachedSeeds,
+    SeedCache
+)
 from em.entity.entities import (
     SeedEntity
 )
 
 from em.entity.specs import (
     EntityFieldSeederSpec,
-    FileFieldSeederSpec
+    FileFieldSeederSpec,
+    FileFormatType
 )
 
-from typing import List, Any
+from typing import Any, Callable, Sequence, Union
 from abc import ABC, abstractmethod
+import time
+import numpy
+import mmap
+import csv
+import os
+
+from loguru import logger
 
 class FieldSeeder(ABC):
     @abstractmethod
-    def get_seeds(self) -> List[Any]:
+    def get_seeds(self) -> Sequence[Any]:
         raise NotImplementedError()
 
+    def is_stale(self) -> bool:
+        return False
+
 class EntityFieldSeeder(FieldSeeder):
     def __init__(self, spec: EntityFieldSeederSpec, entity: type[SeedEntity]) -> None:
+        if spec.watermark and spec.sample:
+            raise Exception(f'Watermark can not be combined with sample, entity={spec.name}, field={spec.field}')
+        if spec.watermark and not spec.cacheTtl:
+            # the last watermark read is kept with the cached seeds
+            raise Exception(f'Watermark must be combined with cacheTtl, entity={spec.name}, field={spec.field}')
         self.spec = spec
         self.entity = entity
-        self.cached_seeds = []
+        self.cached_seeds: numpy.ndarray = None
+        self.fetched_at: float = None
 
-    def get_seeds(self) -> List[Any]:
-        if not self.cached_seeds:
-            self.cached_seeds = self.entity.get_seeds(self.spec.field)
+    def get_seeds(self) -> Sequence[Any]:
+        if self.cached_seeds is None or self.is_stale():
+            self.cached_seeds = self.fetch_seeds(refresh=self.cached_seeds is not None)
+            self.fetched_at = time.monotonic()
         return self.cached_seeds
-    
+
+    def is_stale(self) -> bool:
+        if self.fetched_at is None or not self.spec.refreshInterval:
+            return False
+        return time.monotonic() - self.fetched_at >= self.spec.refreshInterval
+
+    def fetch_seeds(self, refresh: bool = False) -> Sequence[Any]:
+        key = self.entity.get_cache_key(self.spec.field) if self.spec.cacheTtl else None
+        if key is None:
+            return to_seed_array(self.entity.get_seeds(self.spec.field, self.spec.sample, self.spec.sampleMethod))
+
+        # seeds of another run are reused while younger than the ttl, unless refreshed during this run
+        key = (*key, self.spec.sample, self.spec.sampleMethod.value, self.spec.watermark)
+        seed_cache = SeedCache.get_instance()
+        cached = seed_cache.load(key)
+        fetched_at = time.time()
+        if cached and not refresh and fetched_at - cached.fetched_at < self.spec.cacheTtl:
+            logger.debug(f'Read cached seeds, entity={self.spec.name}, field={self.spec.field}, seeds={len(cached.values)}')
+            return to_seed_array(cached.values)
+
+        watermark = None
+        if self.spec.watermark:
+            # rows written while seeds are read are left to the next refresh
+            watermark = self.entity.get_watermark(self.spec.watermark)
+            low = cached.watermark if cached else None
+            if cached and low is not None and (watermark is None or watermark <= low):
+                values, watermark = cached.values, low
+            elif cached and low is not None:
+                added = self.entity.get_seeds(self.spec.field, watermark=self.spec.watermark, low=low, high=watermark)
+                logger.debug(f'Refresh cached seeds, entity={self.spec.name}, field={self.spec.field}, added={len(added)}, watermark={watermark}')
+                previous = cached.values.tolist() if isinstance(cached.values, numpy.ndarray) else cached.values
+                values = list(dict.fromkeys([ *previous, *added ]))
+            else:
+                values = self.entity.get_seeds(self.spec.field, watermark=self.spec.watermark, high=watermark)
+        else:
+            values = self.entity.get_seeds(self.spec.field, self.spec.sample, self.spec.sampleMethod)
+
+        seeds = to_seed_array(values)
+        seed_cache.save(key, CachedSeeds(seeds, fetched_at, watermark))
+        return seeds
+
+class IndexedSeeds(ABC):
+    # seeds read on demand by index instead of held in memory
+    @abstractmethod
+    def __len__(self) -> int:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def take(self, indices: numpy.ndarray) -> numpy.ndarray:
+        raise NotImplementedError()
+
+    def __getitem__(self, index: Union[int, numpy.ndarray]) -> Any:
+        if isinstance(index, numpy.ndarray):
+            return self.take(index)
+        return self.take(numpy.array([index]))[0]
+
+class LineSeeds(IndexedSeeds):
+    # a line offset index is built once and saved next to the file, lines are read from a memory map
+    chunk_size = 64 * 1024 * 1024
+
+    def __init__(self, path: str, encoding: str, skip_lines: int = 0, parse_line: Callable[[str], Any] = None) -> None:
+        self.path = path
+        self.encoding = encoding
+        self.parse_line = parse_line
+        with open(path, 'rb') as f:
+            # an empty file can not be mapped
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b''
+        self.offsets = self.load_offsets()[skip_lines:]
+
+    def __len__(self) -> int:
+        return max(len(self.offsets) - 1, 0)
+
+    def take(self, indices: numpy.ndarray) -> numpy.ndarray:
+        values = numpy.empty(len(indices), dtype=object)
+        starts = self.offsets[indices].tolist()
+        ends = self.offsets[indices + 1].tolist()
+        for i, (start, end) in enumerate(zip(starts, ends)):
+            line = self.map[start:end].decode(self.encoding).rstrip('\r\n')
+            values[i] = self.parse_line(line) if self.parse_line else line
+        return values
+
+    def get_index_path(self) -> str:
+        return f'{self.path}.lines.npy'
+
+    def load_offsets(self) -> numpy.ndarray:
+        index_path = self.get_index_path()
+        if os.path.isfile(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(self.path):
+            offsets = numpy.load(index_path, mmap_mode='r')
+            # the last offset is the size of the indexed file
+            if len(offsets) and offsets[-1] == len(self.map):
+                return offsets
+
+        logger.info(f'Index seed file, path={self.path}')
+        offsets = self.build_offsets()
+        try:
+            with open(f'{index_path}.tmp', 'wb') as f:
+                numpy.save(f, offsets)
+            os.replace(f'{index_path}.tmp', index_path)
+        except OSError as e:
+            logger.warning(f'Seed file index can not be saved, path={index_path}, error={e}')
+        return offsets
+
+    def build_offsets(self) -> numpy.ndarray:
+        # offsets of every line start, followed by the file size
+        chunks = [ numpy.zeros(1, dtype=numpy.int64) ]
+        for start in range(0, len(self.map), self.chunk_size):
+            chunk = numpy.frombuffer(self.map[start:start + self.chunk_size], dtype=numpy.uint8)
+            chunks.append(numpy.flatnonzero(chunk == ord('\n')).astype(numpy.int64) + start + 1)
+        offsets = numpy.concatenate(chunks)
+        if offsets[-1] != len(self.map):
+            offsets = numpy.append(offsets, len(self.map))
+        return offsets
+
+class ArrowSeeds(IndexedSeeds):
+    def __init__(self, column: Any) -> None:
+        self.column = column
+
+    def __len__(self) -> int:
+        return len(self.column)
+
+    def take(self, indices: numpy.ndarray) -> numpy.ndarray:
+        import pyarrow
+
+        values = self.column.take(indices)
+        if values.null_count == 0 and (pyarrow.types.is_integer(values.type) or pyarrow.types.is_floating(values.type)):
+            return values.to_numpy()
+        return to_seed_array(values.to_pylist())
+
 class FileFieldSeeder(FieldSeeder):
+    extension_formats = {
+        '.csv': FileFormatType.CSV,
+        '.tsv': FileFormatType.CSV,
+        '.parquet': FileFormatType.PARQUET,
+        '.pq': FileFormatType.PARQUET,
+        '.arrow': FileFormatType.ARROW,
+        '.feather': FileFormatType.ARROW,
+        '.ipc': FileFormatType.ARROW
+    }
+
     def __init__(self, spec: FileFieldSeederSpec) -> None:
         self.spec = spec
-    
-    def get_seeds(self) -> List[Any]:
-        return []
\ No newline at end of file
+        self.cached_seeds: IndexedSeeds = None
+
+    def get_seeds(self) -> Sequence[Any]:
+        if self.cached_seeds is None:
+            self.cached_seeds = self.load_seeds()
+        return self.cached_seeds
+
+    def get_format(self) -> FileFormatType:
+        if self.spec.format:
+            return self.spec.format
+        _, extension = os.path.splitext(self.spec.path)
+        return self.extension_formats.get(extension.lower(), FileFormatType.TEXT)
+
+    def get_delimiter(self) -> str:
+        if self.spec.delimiter:
+            return self.spec.delimiter
+        _, extension = os.path.splitext(self.spec.path)
+        return '\t' if extension.lower() == '.tsv' else ','
+
+    def load_seeds(self) -> IndexedSeeds:
+        file_format = self.get_format()
+        logger.debug(f'Load seed file, path={self.spec.path}, format={file_format.value}')
+        if file_format == FileFormatType.TEXT:
+            return LineSeeds(self.spec.path, self.spec.encoding)
+        if file_format == FileFormatType.CSV:
+            return self.load_csv_seeds()
+        if file_format == FileFormatType.PARQUET:
+            import pyarrow.parquet
+
+            schema = pyarrow.parquet.read_schema(self.spec.path)
+            column = self.get_column_name(schema.names)
+            table = pyarrow.parquet.read_table(self.spec.path, columns=[column], memory_map=True)
+            return ArrowSeeds(table.column(0))
+        if file_format == FileFormatType.ARROW:
+            import pyarrow
+
+            # record batches of an uncompressed file are read straight from the memory map
+            table = pyarrow.ipc.open_file(pyarrow.memory_map(self.spec.path, 'r')).read_all()
+            return ArrowSeeds(table.column(self.get_column_name(table.column_names)))
+
+    def load_csv_seeds(self) -> LineSeeds:
+        # each record must fit in one line
+        delimiter = self.get_delimiter()
+        column_index = self.spec.column if isinstance(self.spec.column, int) else 0
+        if self.spec.header:
+            with open(self.spec.path, newline='', encoding=self.spec.encoding) as f:
+                header = next(csv.reader(f, delimiter=delimiter), [])
+            if isinstance(self.spec.column, str):
+                if self.spec.column not in header:
+                    raise Exception(f'Column must be in the csv header, path={self.spec.path}, column={self.spec.column}')
+                column_index = header.index(self.spec.column)
+        elif isinstance(self.spec.column, str):
+            raise Exception(f'Column must be a position for a csv file without header, path={self.spec.path}, column={self.spec.column}')
+
+        parse_line = lambda line: next(csv.reader([ line ], delimiter=delimiter))[column_index]
+        return LineSeeds(self.spec.path, self.spec.encoding, skip_lines=1 if self.spec.header else 0, parse_line=parse_line)
+
+    def get_column_name(self, names: Sequence[str]) -> str:
+        if self.spec.column is None:
+            return names[0]
+        if isinstance(self.spec.column, int):
+            return names[self.spec.column]
+        if self.spec.column not in names:
+            raise Exception(f'Column must be in the file, path={self.spec.path}, column={self.spec.column}')
+        return self.spec.column
+
+def to_seed_array(values: Sequence[Any]) -> Union[numpy.ndarray, IndexedSeeds]:
+    # numbers are held in typed arrays, anything else as an array of objects
+    if isinstance(values, (numpy.ndarray, IndexedSeeds)):
+        return values
+    if values and all(type(value) is int for value in values):
+        try:
+            return numpy.array(values, dtype=numpy.int64)
+        except OverflowError:
+            pass
+    elif values and all(type(value) is float for value in values):
+        return numpy.array(values, dtype=numpy.float64)
+    array = numpy.empty(len(values), dtype=object)
+    array[:] = values
+    return array
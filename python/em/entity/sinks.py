@@ -0,0 +1,217 @@
+from abc import abstractmethod
+from typing import Any, Dict, IO, List
+from datetime import date, datetime, time
+import threading
+import lzma
+import gzip
+import bz2
+import csv
+import io
+import os
+
+from em.entity.entities import MockEntity
+from em.entity.previews import RecordValues
+from em.entity.specs import (
+    CompressionType,
+    LoadModeType,
+    MockEntityFieldType,
+    MockEntitySpec
+)
+
+from psycopg import sql
+from loguru import logger
+
+class FileMockEntity(MockEntity):
+    # streams records to a file opened on the first batch and closed once the entity run is written
+    extension: str = None
+    # the first one is the default
+    compressions: List[CompressionType] = []
+    extension_compressions = {
+        '.gz': CompressionType.GZIP,
+        '.bz2': CompressionType.BZ2,
+        '.xz': CompressionType.XZ,
+        '.zst': CompressionType.ZSTD
+    }
+
+    def __init__(self, spec: MockEntitySpec) -> None:
+        super().__init__(spec)
+        self.path = spec.file.path if spec.file.path else f'{spec.name}{self.extension}'
+        self.compression = self.get_compression()
+        if self.compression not in self.compressions:
+            raise Exception(f'Compression is not supported by the file format, entity={spec.name}, compression={self.compression.value}, compressions={[ compression.value for compression in self.compressions ]}')
+        self.opened = False
+        # shards loaded in parallel write to the same file
+        self.lock = threading.Lock()
+
+    def get_compression(self) -> CompressionType:
+        if self.spec.file.compression:
+            return self.spec.file.compression
+        _, extension = os.path.splitext(self.path)
+        # a known extension of an unsupported compression is rejected by the constructor
+        compression = self.extension_compressions.get(extension.lower())
+        return compression if compression else self.compressions[0]
+
+    def load_records(self) -> None:
+        pass
+
+    def insertall(self, records: List[Dict[str, Any]], load_mode: LoadModeType = None) -> None:
+        if not records:
+            return
+        columns = list(records[0].keys())
+        with self.lock:
+            if not self.opened:
+                logger.debug(f'Open {self.spec.name} file, path={self.path}, compression={self.compression.value}')
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self.open(columns)
+                self.opened = True
+            self.write(records)
+        if self.preview:
+            self.preview.add(columns, RecordValues(records))
+
+    def finish(self) -> None:
+        with self.lock:
+            if self.opened:
+                self.close()
+                self.opened = False
+                logger.info(f'Wrote {self.spec.name} file, path={self.path}')
+        super().finish()
+
+    @abstractmethod
+    def open(self, columns: List[str]) -> None:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def close(self) -> None:
+        raise NotImplementedError()
+
+class TextFileMockEntity(FileMockEntity):
+    buffer_size = 1024 * 1024
+    compressions = [ CompressionType.NONE, CompressionType.GZIP, CompressionType.BZ2, CompressionType.XZ ]
+    compressors = {
+        CompressionType.GZIP: lambda raw: gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6),
+        CompressionType.BZ2: lambda raw: bz2.BZ2File(raw, 'wb'),
+        CompressionType.XZ: lambda raw: lzma.LZMAFile(raw, 'wb')
+    }
+
+    def open_text(self) -> IO[str]:
+        self.raw = open(self.path, 'wb', buffering=self.buffer_size)
+        binary = self.compressors[self.compression](self.raw) if self.compression in self.compressors else self.raw
+        return io.TextIOWrapper(binary, encoding=self.spec.file.encoding, newline='', write_through=False)
+
+    def close(self) -> None:
+        # compressors given a file object leave it open
+        self.file.close()
+        if not self.raw.closed:
+            self.raw.close()
+
+class CsvMockEntity(TextFileMockEntity):
+    extension = '.csv'
+
+    def open(self, columns: List[str]) -> None:
+        self.file = self.open_text()
+        self.writer = csv.writer(self.file, delimiter=self.spec.file.delimiter)
+        if self.spec.file.header:
+            self.writer.writerow(columns)
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        self.writer.writerows(record.values() for record in records)
+
+class CopyMockEntity(TextFileMockEntity):
+    # COPY ... FROM stdin in text format, loaded with psql -f
+    extension = '.sql'
+    escapes = str.maketrans({ '\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r' })
+
+    def open(self, columns: List[str]) -> None:
+        self.file = self.open_text()
+        table = sql.Identifier(self.spec.schema if self.spec.schema else 'public', self.spec.name)
+        query = sql.SQL('COPY {table} ({columns}) FROM stdin;\n').format(
+            table=table,
+            columns=sql.SQL(',').join(map(sql.Identifier, columns))
+        )
+        self.file.write(query.as_string(None))
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        self.file.writelines('\t'.join(map(self.format_value, record.values())) + '\n' for record in records)
+
+    def format_value(self, value: Any) -> str:
+        if value is None:
+            return '\\N'
+        if value is True:
+            return 't'
+        if value is False:
+            return 'f'
+        if isinstance(value, (datetime, date, time)):
+            return value.isoformat()
+        return str(value).translate(self.escapes)
+
+    def close(self) -> None:
+        self.file.write('\\.\n')
+        super().close()
+
+class ParquetMockEntity(FileMockEntity):
+    # batches are converted to arrow as they come, then written once they add up to a row group,
+    # numbers are typed from the field specs, other columns are inferred from the first batch,
+    # columns null in every record so far are typed by the first batch with a value
+    extension = '.parquet'
+    compressions = [ CompressionType.SNAPPY, CompressionType.NONE, CompressionType.GZIP, CompressionType.ZSTD ]
+
+    def open(self, columns: List[str]) -> None:
+        self.writer = None
+        self.schema = None
+        self.batches = []
+        self.buffered = 0
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        import pyarrow
+
+        # the schema is fixed once the first row group is written
+        if self.schema is None or (self.writer is None and any(pyarrow.types.is_null(field.type) for field in self.schema)):
+            self.infer_schema(records)
+        self.batches.append(pyarrow.RecordBatch.from_pylist(records, schema=self.schema))
+        self.buffered += len(records)
+        if self.buffered >= self.spec.file.rowGroupSize:
+            self.write_row_group()
+
+    def infer_schema(self, records: List[Dict[str, Any]]) -> None:
+        import pyarrow
+
+        field_types = self.get_field_types()
+        schema = pyarrow.RecordBatch.from_pylist(records).schema
+        # decimal precision inferred from a batch may not fit later values
+        schema = pyarrow.schema([ field.with_type(field_types.get(field.name, pyarrow.decimal128(38, field.type.scale) if pyarrow.types.is_decimal(field.type) else field.type)) for field in schema ])
+        if self.schema is not None:
+            schema = pyarrow.schema([ field if pyarrow.types.is_null(self.schema.field(field.name).type) else self.schema.field(field.name) for field in schema ])
+            # buffered batches of null columns are cast to the type seen later
+            self.batches = [ batch.cast(schema) for batch in self.batches ]
+        self.schema = schema
+
+    def get_field_types(self) -> Dict[str, Any]:
+        import pyarrow
+
+        field_types = {}
+        for field_spec in self.spec.fields:
+            if field_spec.type == MockEntityFieldType.random_int:
+                field_types[field_spec.name] = pyarrow.int64()
+            elif field_spec.type == MockEntityFieldType.random_decimal:
+                field_types[field_spec.name] = pyarrow.decimal128(38, int(field_spec.precision) if field_spec.precision else 3)
+        return field_types
+
+    def write_row_group(self) -> None:
+        import pyarrow
+        import pyarrow.parquet
+
+        if self.writer is None:
+            self.writer = pyarrow.parquet.ParquetWriter(self.path, self.schema, compression=self.compression.value)
+        self.writer.write_table(pyarrow.Table.from_batches(self.batches, schema=self.schema), row_group_size=self.buffered)
+        self.batches = []
+        self.buffered = 0
+
+    def close(self) -> None:
+        if self.batches:
+            self.write_row_group()
+        if self.writer:
+            self.writer.close()
@@ -15,12 +15,65 @@ class TimePrecisionType(str, Enum):
     MINUTE = 'minute'
     SECOND = 'second'
 
+class LoadModeType(str, Enum):
+    INSERT = 'insert'
+    COPY = 'copy'
+
+class WriteModeType(str, Enum):
+    INSERT = 'insert'
+    UPDATE = 'update'
+    UPSERT = 'upsert'
+
+class TransactionType(str, Enum):
+    BATCH = 'batch'
+    RUN = 'run'
+
+class SampleMethodType(str, Enum):
+    TABLESAMPLE = 'tablesample'
+    CURSOR = 'cursor'
+
+class FileFormatType(str, Enum):
+    TEXT = 'text'
+    CSV = 'csv'
+    PARQUET = 'parquet'
+    ARROW = 'arrow'
+
+class PreviewModeType(str, Enum):
+    OFF = 'off'
+    FIRST = 'first'
+    SAMPLE = 'sample'
+    SUMMARY = 'summary'
+
+class CompressionType(str, Enum):
+    NONE = 'none'
+    GZIP = 'gzip'
+    BZ2 = 'bz2'
+    XZ = 'xz'
+    SNAPPY = 'snappy'
+    ZSTD = 'zstd'
+
 class FileFieldSeederSpec(BaseModel):
     path: str
+    format: FileFormatType = None # from the file extension by default
+    # csv, parquet and arrow files, name or position of the column
+    column: Union[int, str] = None
+    # text and csv files
+    encoding: str = 'utf-8'
+    delimiter: str = None # a tab for .tsv files, a comma otherwise
+    header: bool = True
 
 class EntityFieldSeederSpec(BaseModel):
     name: str
     field: str
+    # hold at most sample seeds instead of every distinct value
+    sample: int = Field(default=None, gt=0)
+    sampleMethod: SampleMethodType = SampleMethodType.TABLESAMPLE
+    # seconds before seeds are fetched again
+    refreshInterval: float = Field(default=None, gt=0)
+    # seconds seeds are read from the disk cache before the database is queried again
+    cacheTtl: float = Field(default=None, gt=0)
+    # increasing column, cached seeds are refreshed with the rows above the last value read
+    watermark: str = None
 
 class MockEntityFieldType(str, Enum):
     custom = 'custom'
@@ -38,15 +91,19 @@ class MockEntityFieldSpec(BaseModel):
     min: Union[float, str] = None
     max: Union[float, str] = None
     # random/constant field
-    seeds: List[Union[float, str]] = []
+    seeds: List[Union[int, float, str]] = []
     seedsFromEntity: EntityFieldSeederSpec = None
     seedsFromFile: FileFieldSeederSpec = None
     # custom field
     function: str = None
     dependencies: List[str] = []
+    # function called once per batch with the columns of its dependencies
+    batch: bool = False
     # timestamp field
     format: str = '%Y-%m-%dT%H:%M:%S%z'
-    interval: str = Field(default='1s', patten=r'[0-9]+[s|m|h]')
+    interval: str = Field(default='1s', pattern=r'^[0-9]+(us|ms|s|m|h)$')
+    # current datetime field, added to the clock at each record, records keep increasing across batches
+    increment: str = Field(default=None, pattern=r'^[0-9]+(us|ms|s|m|h)$')
     # random int/decimal field
     precision: Union[RandomIntPrecisionType, RandomDecimalPrecisionType, TimePrecisionType] = None
 
@@ -54,20 +111,76 @@ class SpecType(str, Enum):
     SCENARIO = 'Scenario'
     ENTITY = 'Entity'
 
+class PreviewSpec(BaseModel):
+    mode: PreviewModeType = PreviewModeType.FIRST
+    # at most rows records are held and printed once the entity is written
+    rows: int = Field(default=10, gt=0)
+
+class FileSinkSpec(BaseModel):
+    # <entity name>.<format extension> in the working directory by default
+    path: str = None
+    # from the path extension by default, gzip, bz2 and xz for text files, snappy, gzip and zstd for parquet
+    compression: CompressionType = None
+    encoding: str = 'utf-8'
+    # csv files
+    delimiter: str = ','
+    header: bool = True
+    # parquet files, records buffered before a row group is written
+    rowGroupSize: int = Field(default=100000, gt=0)
+
+class PublishSpec(BaseModel):
+    # mocked fields read by the entities seeded from this one in the same run, instead of the table
+    fields: List[str] = []
+    # columns returned by postgres on insert, such as serial keys
+    returning: List[str] = []
+    # values held per field, a uniform sample of all published values beyond
+    capacity: int = Field(default=1000000, gt=0)
+
+class UpdateSpec(BaseModel):
+    # column identifying rows, existing keys are read from the table like seedsFromEntity
+    key: str
+    # fields written to existing rows, every field but the key by default
+    fields: List[str] = []
+    sample: int = Field(default=None, gt=0)
+    sampleMethod: SampleMethodType = SampleMethodType.TABLESAMPLE
+    # seconds before existing keys are read again, picking up inserted rows
+    refreshInterval: float = Field(default=60, gt=0)
+
 class MockEntitySpec(BaseModel):
     name: str
     implementation: str = None
     fields: List[MockEntityFieldSpec]
     schema: str = None # postgres
+    loadMode: LoadModeType = LoadModeType.INSERT
+    preview: PreviewSpec = PreviewSpec()
+    file: FileSinkSpec = FileSinkSpec() # file sinks
+    publish: PublishSpec = None
+    update: UpdateSpec = None # update and upsert write modes
 
 class ScenarioEntitySpec(BaseModel):
     name: str
     records: int = 1
+    loadMode: LoadModeType = None # overrides entity loadMode
+    batchSize: int = Field(default=1000, gt=0)
+    transaction: TransactionType = TransactionType.BATCH
+    # batches generated ahead while the previous one is written
+    prefetch: int = Field(default=1, ge=0)
+    # records generated and loaded as one unit by a worker, with its own random stream
+    shardSize: int = Field(default=None, gt=0)
+    # connections writing batches concurrently, prefetch batches wait in between
+    connections: int = Field(default=1, gt=0)
+    # records per second written in daemon mode, entities without rate are mocked once at start
+    rate: float = Field(default=None, gt=0)
+    # insert new rows, update existing ones, or upsert records, a share of them with the key of an existing row
+    writeMode: WriteModeType = WriteModeType.INSERT
+    updateRatio: float = Field(default=1.0, gt=0, le=1)
 
 class ScenarioSpec(BaseModel):
     name: str
     description: str = None
     entities: List[ScenarioEntitySpec] = []
+    # run all entities of the scenario in one transaction
+    sharedTransaction: bool = False
 
 class Spec(BaseModel):
     kind: SpecType
@@ -0,0 +1,113 @@
+from typing import Any, Dict, Iterable, Sequence, Tuple
+import threading
+
+import numpy
+
+from em.entity.entities import SeedEntity
+from em.entity.seeders import to_seed_array
+from em.entity.specs import SampleMethodType
+
+class KeyColumn:
+    # published values of a field, numbers in typed arrays, at most capacity values,
+    # a reservoir sample of all published values once full
+    def __init__(self, capacity: int, values: numpy.ndarray = None) -> None:
+        self.capacity = capacity
+        self.values = values
+        self.size = len(values) if values is not None else 0
+        self.seen = self.size
+        self.rng = numpy.random.default_rng()
+
+    def add(self, values: Sequence[Any]) -> None:
+        values = to_seed_array(values)
+        if not len(values):
+            return
+        if self.values is None:
+            self.values = numpy.empty(min(self.capacity, max(len(values), 1024)), dtype=values.dtype)
+        elif values.dtype != self.values.dtype:
+            # mixed types are held as objects
+            self.values = self.values.astype(object)
+            values = values.astype(object)
+
+        filled = min(len(values), self.capacity - self.size)
+        if filled:
+            if self.size + filled > len(self.values):
+                grown = numpy.empty(min(self.capacity, max(2 * len(self.values), self.size + filled)), dtype=self.values.dtype)
+                grown[:self.size] = self.values[:self.size]
+                self.values = grown
+            self.values[self.size:self.size + filled] = values[:filled]
+            self.size += filled
+
+        # the value seen at position i replaces a random slot with probability capacity / (i + 1)
+        rest = values[filled:]
+        if len(rest):
+            slots = self.rng.integers(0, self.seen + filled + numpy.arange(1, len(rest) + 1))
+            replaced = slots < self.capacity
+            self.values[slots[replaced]] = rest[replaced]
+        self.seen += len(values)
+
+    def get(self) -> numpy.ndarray:
+        return self.values[:self.size].copy() if self.values is not None else to_seed_array([])
+
+class KeyStore:
+    # values generated or returned by postgres for the published fields of each entity,
+    # shared by the loaders of a process, generator processes load a snapshot
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.columns: Dict[Tuple[str, str], KeyColumn] = {}
+
+    def publish(self, entity_name: str, field: str, values: Sequence[Any], capacity: int) -> None:
+        with self.lock:
+            column = self.columns.get((entity_name, field))
+            if column is None:
+                column = self.columns[(entity_name, field)] = KeyColumn(capacity)
+            column.add(values)
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        with self.lock:
+            return key in self.columns
+
+    def get(self, entity_name: str, field: str) -> numpy.ndarray:
+        # None when the entity was not written in this run
+        with self.lock:
+            column = self.columns.get((entity_name, field))
+            return column.get() if column else None
+
+    def snapshot(self, entity_names: Iterable[str]) -> Dict[Tuple[str, str], numpy.ndarray]:
+        entity_names = set(entity_names)
+        with self.lock:
+            return { key: column.get() for key, column in self.columns.items() if key[0] in entity_names }
+
+    def load(self, snapshot: Dict[Tuple[str, str], numpy.ndarray]) -> None:
+        with self.lock:
+            for key, values in snapshot.items():
+                self.columns[key] = KeyColumn(max(len(values), 1), values)
+
+key_store = KeyStore()
+
+class PublishedSeedEntity(SeedEntity):
+    # seeds from the values published in this run, from the fallback entity when nothing was published
+    def __init__(self, name: str, fallback: SeedEntity = None) -> None:
+        super().__init__(name)
+        self.fallback = fallback
+
+    def get_seeds(self, field: str, sample: int = None, sample_method: SampleMethodType = None, watermark: str = None, low: Any = None, high: Any = None) -> Sequence[Any]:
+        values = key_store.get(self.name, field)
+        if values is None:
+            if self.fallback is None:
+                raise Exception(f'Seed entity must be written before its published fields are read, entity={self.name}, field={field}')
+            return self.fallback.get_seeds(field, sample, sample_method, watermark, low, high)
+        # evenly spaced values in publication order, without replacement like the distinct values of a table
+        if sample and len(values) > sample:
+            values = values[numpy.linspace(0, len(values) - 1, sample).astype(numpy.int64)]
+        return values
+
+    def get_watermark(self, column: str) -> Any:
+        if (self.name, column) in key_store or self.fallback is None:
+            return super().get_watermark(column)
+        return self.fallback.get_watermark(column)
+
+    def get_cache_key(self, field: str) -> Tuple[Any, ...]:
+        # published values are never cached on disk
+        if (self.name, field) in key_store or self.fallback is None:
+            return None
+        return self.fallback.get_cache_key(field)
@@ -0,0 +1,66 @@
+from typing import Iterable, Iterator, List, TypeVar
+import threading
+import random
+import queue
+
+T = TypeVar('T')
+
+_DONE = object()
+
+def prefetch(iterable: Iterable[T], size: int) -> Iterator[T]:
+    if size < 1:
+        yield from iterable
+        return
+
+    items = queue.Queue(maxsize=size)
+    stopped = threading.Event()
+
+    def put(item, error: Exception = None) -> bool:
+        # False once the consumer stopped reading
+        while not stopped.is_set():
+            try:
+                items.put((item, error), timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in iterable:
+                if not put(item):
+                    # no batch is generated once nobody reads them
+                    break
+            else:
+                put(_DONE)
+        except Exception as e:
+            put(_DONE, e)
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error:
+                raise error
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        stopped.set()
+
+def reservoir_sample(iterable: Iterable[T], size: int, rng: random.Random = None) -> List[T]:
+    # uniform sample of at most size items, holding no more than size items at a time
+    rng = rng if rng else random.Random()
+    sample = []
+    for i, item in enumerate(iterable):
+        if i < size:
+            sample.append(item)
+        else:
+            j = rng.randrange(i + 1)
+            if j < size:
+                sample[j] = item
+    return sample
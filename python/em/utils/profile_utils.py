@@ -0,0 +1,99 @@
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Tuple
+import threading
+import asyncio
+import json
+import time
+
+from prettytable import PrettyTable
+
+class Profiler:
+    # cumulative calls, seconds and rows per stage and name, nothing is measured while disabled
+    def __init__(self) -> None:
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.stats: Dict[Tuple[str, str], List[float]] = {}
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def record(self, stage: str, name: str, seconds: float, rows: int = 0, calls: int = 1) -> None:
+        with self.lock:
+            stat = self.stats.setdefault((stage, name), [ 0, 0.0, 0 ])
+            stat[0] += calls
+            stat[1] += seconds
+            stat[2] += rows
+
+    def measure(self, stage: str, name: str, rows: int = 0) -> ContextManager[None]:
+        if not self.enabled:
+            return nullcontext()
+        return self.timed(stage, name, rows)
+
+    @contextmanager
+    def timed(self, stage: str, name: str, rows: int) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, name, time.perf_counter() - started_at, rows)
+
+    def instrument(self, obj: Any, method: str, stage: str, name: str, count_rows: Callable[[tuple, Any], int] = None) -> None:
+        # replaces the method of obj by a timed one, objects built while disabled are never touched
+        if not self.enabled:
+            return
+        function = getattr(obj, method)
+        def timed_function(*args, **kwargs):
+            started_at = time.perf_counter()
+            result = function(*args, **kwargs)
+            self.record(stage, name, time.perf_counter() - started_at, count_rows(args, result) if count_rows else 0)
+            return result
+        async def timed_coroutine_function(*args, **kwargs):
+            started_at = time.perf_counter()
+            result = await function(*args, **kwargs)
+            self.record(stage, name, time.perf_counter() - started_at, count_rows(args, result) if count_rows else 0)
+            return result
+        setattr(obj, method, timed_coroutine_function if asyncio.iscoroutinefunction(function) else timed_function)
+
+    def collect(self) -> Dict[Tuple[str, str], List[float]]:
+        # stats recorded since the last collect, to be merged by another process
+        with self.lock:
+            stats, self.stats = self.stats, {}
+        return stats
+
+    def merge(self, stats: Dict[Tuple[str, str], List[float]]) -> None:
+        for (stage, name), (calls, seconds, rows) in stats.items():
+            self.record(stage, name, seconds, rows, calls)
+
+    def get_rows(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            stats = sorted(self.stats.items(), key=lambda item: (item[0][0], -item[1][1]))
+        return [ { 'stage': stage, 'name': name, 'calls': calls, 'seconds': seconds, 'rows': rows } for (stage, name), (calls, seconds, rows) in stats ]
+
+    def print(self) -> None:
+        table = PrettyTable()
+        table.title = 'profile'
+        table.field_names = [ 'stage', 'name', 'calls', 'seconds', 'ms/call', 'rows', 'ns/row' ]
+        table.align = 'r'
+        table.align['name'] = 'l'
+        for row in self.get_rows():
+            name = row['name'] if len(row['name']) <= 60 else row['name'][:57] + '...'
+            ns_per_row = f'{1e9 * row["seconds"] / row["rows"]:,.0f}' if row['rows'] else ''
+            table.add_row([ row['stage'], name, row['calls'], f'{row["seconds"]:.3f}', f'{1e3 * row["seconds"] / row["calls"]:.3f}', row['rows'], ns_per_row ])
+        print(table)
+
+    def write(self, path: str) -> None:
+        # json for .json files, prometheus text format otherwise
+        rows = self.get_rows()
+        with open(path, 'w') as f:
+            if path.lower().endswith('.json'):
+                json.dump(rows, f, indent=2)
+                return
+            for metric, key, help_text in [ ('em_profile_calls_total', 'calls', 'Calls'), ('em_profile_seconds_total', 'seconds', 'Cumulative seconds'), ('em_profile_rows_total', 'rows', 'Records') ]:
+                f.write(f'# HELP {metric} {help_text} per stage and name\n# TYPE {metric} counter\n')
+                for row in rows:
+                    f.write(f'{metric}{{stage="{escape_label(row["stage"])}",name="{escape_label(row["name"])}"}} {row[key]}\n')
+
+def escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+profiler = Profiler()
@@ -0,0 +1,25 @@
+from typing import Union
+from numpy.random import Generator, Philox, SeedSequence
+import numpy
+import zlib
+
+def derive_seed_sequence(seed: int, *keys: Union[int, str]) -> SeedSequence:
+    # streams are keyed by names and indices, so they do not depend on the order they are created in
+    spawn_key = tuple(key if isinstance(key, int) else zlib.crc32(key.encode()) for key in keys)
+    return SeedSequence(seed, spawn_key=spawn_key)
+
+class RandomStreams:
+    # counter-based generator, the stream of an index starts at the counter (0, 0, index, stream),
+    # so any stream is reached without drawing the ones before it
+    def __init__(self, seed: int, *keys: Union[int, str]) -> None:
+        self.bit_generator = Philox(key=derive_seed_sequence(seed, *keys).generate_state(2, numpy.uint64))
+        self.generator = Generator(self.bit_generator)
+        self.state = self.bit_generator.state
+
+    def get(self, stream: int, index: int) -> Generator:
+        # the generator is shared, it is only valid until the next call
+        self.bit_generator.state = {
+            **self.state,
+            'state': { 'counter': numpy.array([ 0, 0, index, stream ], dtype=numpy.uint64), 'key': self.state['state']['key'] }
+        }
+        return self.generator
@@ -0,0 +1,26 @@
+import threading
+import time
+
+class TokenBucket:
+    # tokens accrue at rate per second up to capacity, a caller taking more tokens than available
+    # goes into debt and waits until it is paid back, so consecutive takes are evenly spaced
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        if rate <= 0:
+            raise Exception(f'Token bucket rate must be positive, rate={rate}')
+        self.rate = rate
+        self.capacity = capacity if capacity else rate
+        self.tokens = 0.0
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float, stopped: threading.Event = None) -> bool:
+        # returns False if stopped while waiting
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate) - tokens
+            self.updated_at = now
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if stopped:
+            return not stopped.wait(wait) if wait else not stopped.is_set()
+        time.sleep(wait)
+        return True